@@ -0,0 +1,125 @@
+"""
+Card read engine: physical-order scheduling and page cache hints
+"""
+
+import os
+import fcntl
+import struct
+import logging
+from typing import Iterator, List, Optional
+
+
+# linux/fiemap.h
+FS_IOC_FIEMAP = 0xC020660B
+FIEMAP_HEADER = struct.Struct('=QQLLLL')
+FIEMAP_EXTENT = struct.Struct('=QQQQQLLLL')
+
+PAGE_SIZE = 4096
+
+
+class CardReader:
+    """Reads files from the SD card with kernel hints tuned for streaming.
+
+    Files are ordered by on-disk position so the card reader streams instead
+    of seeking, reads are issued in large page-aligned chunks with sequential
+    readahead, and pages already handed to the uploader are dropped so RAW
+    data does not evict everything else from the page cache.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.logger = logging.getLogger(__name__)
+        self.transfer_config = config.get_transfer_config()
+
+        chunk_size = self.transfer_config.get('chunk_size', 1048576)
+        self.chunk_size = max(PAGE_SIZE, (chunk_size // PAGE_SIZE) * PAGE_SIZE)
+        self.read_ahead = self.transfer_config.get('read_ahead', 8 * 1024 * 1024)
+        self.drop_cache = self.transfer_config.get('drop_cache', True)
+        self.physical_order = self.transfer_config.get('physical_order', True)
+
+        self.fadvise_supported = hasattr(os, 'posix_fadvise')
+
+    def order_files(self, file_paths: List[str]) -> List[str]:
+        """Order files by physical location on the card, falling back to inode order"""
+        if not self.physical_order or len(file_paths) < 2:
+            return list(file_paths)
+
+        offsets = {path: self._physical_offset(path) for path in file_paths}
+        # Filesystems without real block mapping report the same offset for every file
+        if None not in offsets.values() and len(set(offsets.values())) > 1:
+            self.logger.debug("Ordering files by on-disk extent")
+            return sorted(file_paths, key=lambda path: (offsets[path], path))
+
+        # FAT/exFAT inode numbers follow directory entry position, a fair proxy
+        self.logger.debug("Extent map unavailable, ordering files by inode")
+        return sorted(file_paths, key=lambda path: (self._inode(path), path))
+
+    def read_chunks(self, local_path: str, keep_cache: bool = False) -> Iterator[bytes]:
+        """Yield the file in aligned chunks with readahead and cache-drop hints"""
+        drop_cache = self.drop_cache and not keep_cache
+        fd = os.open(local_path, os.O_RDONLY)
+        try:
+            self._advise(fd, 0, 0, 'POSIX_FADV_SEQUENTIAL')
+
+            offset = 0
+            hinted = 0
+            dropped = 0
+            while True:
+                # Keep a readahead window in flight ahead of the reader
+                if hinted < offset + self.read_ahead:
+                    self._advise(fd, hinted, self.read_ahead, 'POSIX_FADV_WILLNEED')
+                    hinted += self.read_ahead
+
+                chunk = os.read(fd, self.chunk_size)
+                if not chunk:
+                    break
+
+                yield chunk
+                offset += len(chunk)
+
+                # Drop pages the uploader is done with; keep them page aligned
+                if drop_cache:
+                    drop_to = (offset // PAGE_SIZE) * PAGE_SIZE
+                    if drop_to > dropped:
+                        self._advise(fd, dropped, drop_to - dropped, 'POSIX_FADV_DONTNEED')
+                        dropped = drop_to
+
+            if drop_cache:
+                self._advise(fd, 0, 0, 'POSIX_FADV_DONTNEED')
+
+        finally:
+            os.close(fd)
+
+    def _advise(self, fd: int, offset: int, length: int, advice: str):
+        """Apply a posix_fadvise hint, ignoring unsupported platforms"""
+        if not self.fadvise_supported:
+            return
+        try:
+            os.posix_fadvise(fd, offset, length, getattr(os, advice))
+        except OSError as e:
+            self.logger.debug(f"posix_fadvise({advice}) failed: {e}")
+
+    def _physical_offset(self, path: str) -> Optional[int]:
+        """Physical byte offset of the first extent of a file (FIEMAP)"""
+        request = bytearray(FIEMAP_HEADER.size + FIEMAP_EXTENT.size)
+        FIEMAP_HEADER.pack_into(request, 0, 0, 0xFFFFFFFFFFFFFFFF, 0, 0, 1, 0)
+
+        try:
+            with open(path, 'rb') as f:
+                fcntl.ioctl(f.fileno(), FS_IOC_FIEMAP, request)
+        except OSError:
+            return None
+
+        mapped_extents = FIEMAP_HEADER.unpack_from(request, 0)[3]
+        if mapped_extents == 0:
+            return None
+
+        return FIEMAP_EXTENT.unpack_from(request, FIEMAP_HEADER.size)[1]
+
+    @staticmethod
+    def _inode(path: str) -> int:
+        """Inode number of a file (0 if unavailable)"""
+        try:
+            return os.stat(path).st_ino
+        except OSError:
+            return 0
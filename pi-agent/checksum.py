@@ -0,0 +1,156 @@
+"""
+Pluggable checksum engine for transfer verification
+"""
+
+import os
+import hashlib
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+
+HASH_FUNCTIONS = {
+    'sha256': hashlib.sha256,
+    'blake2b': hashlib.blake2b,
+}
+
+DEFAULT_LEAF_SIZE = 4 * 1024 * 1024
+
+
+class ChecksumEngine:
+    """Creates hashers for the configured checksum scheme.
+
+    Digests are returned as self-describing strings so the server can verify
+    with the same scheme:
+
+    - ``sha256:<hex>`` / ``blake2b:<hex>``: plain digest of the file
+    - ``tree-<hash>-<leaf_size>:<hex>``: digest of the concatenated digests of
+      fixed-size leaves; leaves are hashed in parallel because hashlib releases
+      the GIL on large buffers
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.logger = logging.getLogger(__name__)
+        checksum_config = config.get_transfer_config().get('checksum', {})
+
+        self.algorithm = checksum_config.get('algorithm', 'sha256')
+        self.tree_hash = checksum_config.get('tree_hash', 'blake2b')
+        self.leaf_size = checksum_config.get('leaf_size', DEFAULT_LEAF_SIZE)
+        self.workers = checksum_config.get('workers') or os.cpu_count() or 1
+
+        if self.algorithm == 'tree':
+            if self.tree_hash not in HASH_FUNCTIONS:
+                raise ValueError(f"Unknown tree hash: {self.tree_hash}")
+        elif self.algorithm not in HASH_FUNCTIONS:
+            raise ValueError(f"Unknown checksum algorithm: {self.algorithm}")
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def scheme(self) -> str:
+        """Digest scheme prefix recorded alongside every checksum"""
+        if self.algorithm == 'tree':
+            return f"tree-{self.tree_hash}-{self.leaf_size}"
+        return self.algorithm
+
+    def new(self):
+        """Create a streaming hasher for one file"""
+        if self.algorithm == 'tree':
+            return TreeHasher(self.scheme, HASH_FUNCTIONS[self.tree_hash], self.leaf_size,
+                              self._get_executor(), self.workers * 2)
+        return PlainHasher(self.scheme, HASH_FUNCTIONS[self.algorithm]())
+
+    def shutdown(self):
+        """Stop the leaf hashing pool"""
+        if self._executor:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Lazily start the shared leaf hashing pool"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="checksum")
+        return self._executor
+
+
+class PlainHasher:
+    """Single-stream hashlib digest"""
+
+    def __init__(self, scheme: str, hash_object):
+        self.scheme = scheme
+        self.hash_object = hash_object
+
+    def update(self, data: bytes):
+        """Feed data into the digest"""
+        self.hash_object.update(data)
+
+    def hexdigest(self) -> str:
+        """Return the scheme-prefixed digest"""
+        return f"{self.scheme}:{self.hash_object.hexdigest()}"
+
+
+class TreeHasher:
+    """Hash list over fixed-size leaves, hashed concurrently on a thread pool"""
+
+    def __init__(self, scheme: str, hash_function, leaf_size: int,
+                 executor: ThreadPoolExecutor, max_in_flight: int):
+        self.scheme = scheme
+        self.hash_function = hash_function
+        self.leaf_size = leaf_size
+        self.executor = executor
+        self.max_in_flight = max(max_in_flight, 1)
+
+        self._buffer = []
+        self._buffered = 0
+        self._pending = deque()
+        self._leaf_count = 0
+        self._root = hash_function()
+        self._digest = None
+
+    def update(self, data: bytes):
+        """Feed data, submitting every complete leaf"""
+        view = memoryview(data)
+        while view:
+            take = min(len(view), self.leaf_size - self._buffered)
+            self._buffer.append(view[:take])
+            self._buffered += take
+            view = view[take:]
+
+            if self._buffered == self.leaf_size:
+                self._submit(self._take_leaf())
+
+    def hexdigest(self) -> str:
+        """Flush the final leaf and return the scheme-prefixed root digest"""
+        if self._digest is None:
+            # An empty file still hashes one (empty) leaf
+            if self._buffered or self._leaf_count == 0:
+                self._submit(self._take_leaf())
+
+            while self._pending:
+                self._root.update(self._pending.popleft().result())
+
+            self._digest = f"{self.scheme}:{self._root.hexdigest()}"
+
+        return self._digest
+
+    def _take_leaf(self) -> bytes:
+        """Join the buffered pieces into one leaf"""
+        leaf = b''.join(self._buffer)
+        self._buffer = []
+        self._buffered = 0
+        return leaf
+
+    def _submit(self, leaf: bytes):
+        """Hash a leaf in the pool, folding finished leaves into the root in order"""
+        self._leaf_count += 1
+        self._pending.append(self.executor.submit(self._hash_leaf, leaf))
+
+        # Bound memory held by queued leaves
+        while len(self._pending) > self.max_in_flight:
+            self._root.update(self._pending.popleft().result())
+
+    def _hash_leaf(self, leaf: bytes) -> bytes:
+        """Digest of a single leaf"""
+        return self.hash_function(leaf).digest()
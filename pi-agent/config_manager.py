@@ -34,6 +34,10 @@ class ConfigManager:
         """Get file transfer configuration"""
         return self.config.get('transfer', {})
         
+    def get_destinations_config(self) -> List[Dict[str, Any]]:
+        """Get additional transfer destinations (besides the primary SMB share)"""
+        return self.config.get('destinations', [])
+        
     def get_monitoring_config(self) -> Dict[str, Any]:
         """Get monitoring configuration"""
         return self.config.get('monitoring', {})
@@ -42,6 +46,18 @@ class ConfigManager:
         """Get logging configuration"""
         return self.config.get('logging', {})
         
+    def get_progress_config(self) -> Dict[str, Any]:
+        """Get progress event server configuration"""
+        return self.config.get('progress', {})
+        
+    def get_profiling_config(self) -> Dict[str, Any]:
+        """Get runtime profiling configuration"""
+        return self.config.get('profiling', {})
+        
+    def get_coordinator_config(self) -> Dict[str, Any]:
+        """Get fleet coordinator configuration"""
+        return self.config.get('coordinator', {})
+        
     def get_poll_interval(self) -> int:
         """Get polling interval in seconds"""
         return self.get_monitoring_config().get('poll_interval', 2)
@@ -54,6 +70,10 @@ class ConfigManager:
         """Get minimum file size for processing"""
         return self.get_monitoring_config().get('min_file_size', 1000000)
         
+    def get_raw_jpeg_policy(self) -> str:
+        """Get how RAW+JPEG pairs are transferred (both, jpeg_first or raw_only)"""
+        return self.get_monitoring_config().get('raw_jpeg_policy', 'both')
+        
     def get_sd_mount_base(self) -> str:
         """Get SD card mount base path"""
         return self.get_paths_config().get('sd_mount_base', '/media/pi')
@@ -0,0 +1,524 @@
+#!/usr/bin/env python3
+"""
+Fleet coordination for several agents ingesting into the same share
+
+The coordinator is a small HTTP service (run it on the server, or on
+localhost for tests) that hands out ingest slots, splits a global bandwidth
+budget between the active agents, deduplicates content across agents by
+checksum and collects fleet-wide throughput. Agents talk to it through
+CoordinatorClient; when it is unreachable they ingest uncoordinated.
+"""
+
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import argparse
+import threading
+import logging
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Optional, Tuple
+
+import requests
+
+
+class ContentState:
+    """Cross-agent content index states"""
+    CLAIMED = "claimed"
+    STORED = "stored"
+
+
+class FleetCoordinator:
+    """Leases ingest slots and tracks fleet throughput and content.
+
+    Slots are granted first come, first served; agents that are waiting
+    keep their place as long as they keep polling. Each active lease gets
+    an equal share of the bandwidth budget, recomputed on every heartbeat,
+    so the aggregate stays at the configured rate as agents come and go.
+    """
+
+    RATE_WINDOW = 30  # seconds of heartbeat reports used for throughput
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8766, slots: int = 2,
+                 bandwidth: Optional[float] = None, lease_ttl: float = 60, claim_ttl: float = 900,
+                 db_path: str = ':memory:'):
+        self.host = host
+        self.port = port
+        self.slots = slots
+        self.bandwidth = bandwidth
+        self.lease_ttl = lease_ttl
+        self.claim_ttl = claim_ttl
+        self.logger = logging.getLogger(__name__)
+
+        self._lock = threading.Lock()
+        self._leases: Dict[str, Dict[str, Any]] = {}
+        self._waiting: OrderedDict = OrderedDict()  # (agent, session) -> last poll
+        self._agents: Dict[str, Dict[str, Any]] = {}
+
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS content (checksum TEXT PRIMARY KEY, size INTEGER NOT NULL, "
+            "path TEXT NOT NULL, agent TEXT NOT NULL, state TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+        self._httpd = None
+        self._threads = []
+        self._stop_event = threading.Event()
+
+    @property
+    def server_address(self) -> Tuple[str, int]:
+        """Address the server is bound to (useful when configured with port 0)"""
+        if self._httpd:
+            return self._httpd.server_address[:2]
+        return (self.host, self.port)
+
+    def start(self):
+        """Start the HTTP server and housekeeping threads"""
+        self._stop_event.clear()
+        self._httpd = ThreadingHTTPServer((self.host, self.port), self._make_handler())
+        self._httpd.daemon_threads = True
+
+        self._threads = [
+            threading.Thread(target=self._httpd.serve_forever, name="coordinator-http", daemon=True),
+            threading.Thread(target=self._housekeeping_loop, name="coordinator-housekeeping", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+        host, port = self.server_address
+        rate = f"{self.bandwidth / (1024 * 1024):.1f} MB/s" if self.bandwidth else "unlimited"
+        self.logger.info(f"Fleet coordinator listening on http://{host}:{port} ({self.slots} slots, {rate})")
+
+    def stop(self):
+        """Stop the server"""
+        self._stop_event.set()
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+        for thread in self._threads:
+            thread.join(timeout=2)
+        self._threads = []
+
+    # Ingest slots
+
+    def acquire(self, agent: str, session: str, total_bytes: int = 0) -> Dict[str, Any]:
+        """Grant a slot if one is free and the caller is next in line"""
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+
+            for lease_id, lease in self._leases.items():
+                if lease['agent'] == agent and lease['session'] == session:
+                    return self._grant(lease_id)
+
+            key = (agent, session)
+            self._waiting[key] = now
+            position = list(self._waiting).index(key)
+
+            if position < self.slots - len(self._leases):
+                del self._waiting[key]
+                lease_id = uuid.uuid4().hex
+                self._leases[lease_id] = {
+                    'agent': agent, 'session': session, 'total_bytes': total_bytes,
+                    'granted_at': now, 'expires': now + self.lease_ttl,
+                }
+                self._agent(agent)['sessions'] += 1
+                self.logger.info(f"Slot granted to {agent} for {session} ({len(self._leases)}/{self.slots} in use)")
+                return self._grant(lease_id)
+
+            return {'granted': False, 'position': position + 1, 'retry_after': min(5.0, self.lease_ttl / 3)}
+
+    def renew(self, lease_id: str, bytes_done: int = 0, files_done: int = 0) -> Optional[Dict[str, Any]]:
+        """Heartbeat: extend the lease, record progress and return the current rate; None if unknown"""
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            lease = self._leases.get(lease_id)
+            if lease is None:
+                return None
+            lease['expires'] = now + self.lease_ttl
+            self._record(lease['agent'], bytes_done, files_done, now)
+            return self._grant(lease_id)
+
+    def release(self, lease_id: str, bytes_done: int = 0, files_done: int = 0):
+        """Return a slot, recording the final progress report"""
+        with self._lock:
+            lease = self._leases.pop(lease_id, None)
+            if lease is None:
+                return
+            self._record(lease['agent'], bytes_done, files_done, time.time())
+            self.logger.info(f"Slot released by {lease['agent']} for {lease['session']}")
+
+    # Content deduplication
+
+    def claim_content(self, agent: str, checksum: str, size: int, path: str) -> Dict[str, Any]:
+        """Reserve a checksum for upload, or report where the content already is"""
+        now = time.time()
+        with self._lock, self.conn:
+            row = self.conn.execute(
+                "SELECT size, path, agent, state, updated_at FROM content WHERE checksum = ?", (checksum,)
+            ).fetchone()
+
+            if row is not None and row[0] == size:
+                stored_size, stored_path, owner, state, updated_at = row
+                if state == ContentState.STORED:
+                    stats = self._agent(agent)
+                    stats['dedup_hits'] += 1
+                    stats['dedup_bytes'] += size
+                    return {'status': 'exists', 'path': stored_path, 'agent': owner}
+                if owner != agent and now - updated_at < self.claim_ttl:
+                    return {'status': 'in_progress', 'path': stored_path, 'agent': owner}
+
+            self.conn.execute(
+                "INSERT OR REPLACE INTO content (checksum, size, path, agent, state, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (checksum, size, path, agent, ContentState.CLAIMED, now)
+            )
+            return {'status': 'new'}
+
+    def commit_content(self, agent: str, checksum: str, size: int, path: str):
+        """Mark content as stored at path"""
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO content (checksum, size, path, agent, state, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (checksum, size, path, agent, ContentState.STORED, time.time())
+            )
+
+    def abandon_content(self, agent: str, checksum: str):
+        """Drop a claim whose upload failed so another agent may take it"""
+        with self._lock, self.conn:
+            self.conn.execute(
+                "DELETE FROM content WHERE checksum = ? AND agent = ? AND state = ?",
+                (checksum, agent, ContentState.CLAIMED)
+            )
+
+    # Reporting
+
+    def stats(self) -> Dict[str, Any]:
+        """Fleet and per-agent throughput, slot usage and dedup savings"""
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            agents = {}
+            for name, agent in self._agents.items():
+                agents[name] = {
+                    'rate': self._rate(agent, now),
+                    'bytes': agent['bytes'],
+                    'files': agent['files'],
+                    'sessions': agent['sessions'],
+                    'dedup_hits': agent['dedup_hits'],
+                    'dedup_bytes': agent['dedup_bytes'],
+                }
+            return {
+                'rate': sum(agent['rate'] for agent in agents.values()),
+                'bytes': sum(agent['bytes'] for agent in agents.values()),
+                'slots': self.slots,
+                'active': [
+                    {'agent': lease['agent'], 'session': lease['session'], 'since': lease['granted_at']}
+                    for lease in self._leases.values()
+                ],
+                'waiting': [{'agent': agent, 'session': session} for agent, session in self._waiting],
+                'agents': agents,
+            }
+
+    def _grant(self, lease_id: str) -> Dict[str, Any]:
+        """Lease response with this lease's bandwidth share; lock held"""
+        rate = self.bandwidth / len(self._leases) if self.bandwidth else None
+        return {'granted': True, 'lease_id': lease_id, 'ttl': self.lease_ttl, 'rate': rate}
+
+    def _expire(self, now: float):
+        """Drop leases of agents that stopped heartbeating and waiters that stopped polling; lock held"""
+        for lease_id in [lease_id for lease_id, lease in self._leases.items() if lease['expires'] < now]:
+            lease = self._leases.pop(lease_id)
+            self.logger.warning(f"Lease of {lease['agent']} for {lease['session']} expired")
+        for key in [key for key, polled in self._waiting.items() if now - polled > self.lease_ttl]:
+            del self._waiting[key]
+
+    def _agent(self, agent: str) -> Dict[str, Any]:
+        """Per-agent counters; lock held"""
+        if agent not in self._agents:
+            self._agents[agent] = {
+                'bytes': 0, 'files': 0, 'sessions': 0, 'dedup_hits': 0, 'dedup_bytes': 0,
+                'samples': deque(),
+            }
+        return self._agents[agent]
+
+    def _record(self, agent: str, bytes_done: int, files_done: int, now: float):
+        """Add a progress report; lock held"""
+        stats = self._agent(agent)
+        stats['bytes'] += bytes_done
+        stats['files'] += files_done
+        stats['samples'].append((now, bytes_done))
+        while stats['samples'] and now - stats['samples'][0][0] > self.RATE_WINDOW:
+            stats['samples'].popleft()
+
+    def _rate(self, agent: Dict[str, Any], now: float) -> float:
+        """Bytes per second over the recent report window; lock held"""
+        samples = [(at, nbytes) for at, nbytes in agent['samples'] if now - at <= self.RATE_WINDOW]
+        if not samples:
+            return 0.0
+        return sum(nbytes for _, nbytes in samples) / self.RATE_WINDOW
+
+    def _housekeeping_loop(self):
+        """Expire stale leases and log fleet throughput while agents are active"""
+        while not self._stop_event.wait(min(self.lease_ttl / 3, 30)):
+            stats = self.stats()
+            if stats['active']:
+                self.logger.info(
+                    f"Fleet: {stats['rate'] / (1024 * 1024):.1f} MB/s, "
+                    f"{len(stats['active'])}/{self.slots} slots, {len(stats['waiting'])} waiting"
+                )
+
+    def _make_handler(self):
+        """Build the request handler bound to this coordinator"""
+        coordinator = self
+
+        class CoordinatorRequestHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] == '/stats':
+                    self._send_json(coordinator.stats())
+                else:
+                    self.send_error(404)
+
+            def do_POST(self):
+                try:
+                    length = int(self.headers.get('Content-Length', 0))
+                    body = json.loads(self.rfile.read(length) or b'{}')
+                    response = self._route(self.path.split('?', 1)[0], body)
+                except (ValueError, KeyError, TypeError) as e:
+                    self._send_json({'error': str(e)}, 400)
+                    return
+
+                if response is None:
+                    self._send_json({'error': 'unknown lease'}, 404)
+                else:
+                    self._send_json(response)
+
+            def _route(self, path: str, body: Dict[str, Any]):
+                if path == '/lease':
+                    return coordinator.acquire(body['agent'], body['session'], body.get('total_bytes', 0))
+                if path == '/lease/renew':
+                    return coordinator.renew(body['lease_id'], body.get('bytes', 0), body.get('files', 0))
+                if path == '/lease/release':
+                    coordinator.release(body['lease_id'], body.get('bytes', 0), body.get('files', 0))
+                    return {}
+                if path == '/content/claim':
+                    return coordinator.claim_content(body['agent'], body['checksum'], body['size'], body['path'])
+                if path == '/content/commit':
+                    coordinator.commit_content(body['agent'], body['checksum'], body['size'], body['path'])
+                    return {}
+                if path == '/content/abandon':
+                    coordinator.abandon_content(body['agent'], body['checksum'])
+                    return {}
+                raise KeyError(f"unknown endpoint {path}")
+
+            def _send_json(self, payload, status: int = 200):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                coordinator.logger.debug(f"{self.address_string()} {format % args}")
+
+        return CoordinatorRequestHandler
+
+
+class CoordinatorClient:
+    """Agent side of fleet coordination.
+
+    Every call degrades to uncoordinated ingest when the coordinator cannot
+    be reached: slots are assumed granted, no bandwidth cap is applied and
+    every file is treated as new.
+    """
+
+    def __init__(self, config):
+        self.logger = logging.getLogger(__name__)
+        coordinator_config = config.get_coordinator_config()
+
+        self.url = coordinator_config.get('url', 'http://127.0.0.1:8766').rstrip('/')
+        self.agent_id = coordinator_config.get('agent_id') or socket.gethostname()
+        self.dedup = coordinator_config.get('dedup', True)
+        self.timeout = coordinator_config.get('timeout', 5)
+
+        self.lease_id = None
+        self.rate: Optional[float] = None
+        self._session = None
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._unreported_bytes = 0
+        self._unreported_files = 0
+        self._bucket_time = 0.0
+        self._heartbeat = None
+        self._stop_event = threading.Event()
+
+    def acquire(self, session: str, total_bytes: int = 0) -> bool:
+        """Wait for an ingest slot; False means proceeding uncoordinated"""
+        self._session = session
+        self._total_bytes = total_bytes
+        announced = False
+
+        while True:
+            response = self._post('/lease', {'agent': self.agent_id, 'session': session, 'total_bytes': total_bytes})
+            if response is None:
+                self.logger.warning("Fleet coordinator unreachable, ingesting uncoordinated")
+                return False
+            if response.get('granted'):
+                break
+            if not announced:
+                self.logger.info(f"Waiting for an ingest slot (position {response.get('position')})")
+                announced = True
+            time.sleep(response.get('retry_after', 5))
+
+        self._adopt(response)
+        self._bucket_time = time.monotonic()
+        self._stop_event.clear()
+        self._heartbeat = threading.Thread(
+            target=self._heartbeat_loop, args=(response.get('ttl', 60) / 3,), name="coordinator-heartbeat", daemon=True
+        )
+        self._heartbeat.start()
+        self.logger.info(f"Ingest slot granted{self._rate_text()}")
+        return True
+
+    def release(self):
+        """Return the slot with the final progress report"""
+        self._stop_event.set()
+        if self._heartbeat:
+            self._heartbeat.join(timeout=self.timeout)
+            self._heartbeat = None
+        if self.lease_id:
+            bytes_done, files_done = self._take_report()
+            self._post('/lease/release', {'lease_id': self.lease_id, 'bytes': bytes_done, 'files': files_done})
+            self.lease_id = None
+        self.rate = None
+
+    def throttle(self, nbytes: int):
+        """Account for sent bytes and sleep to stay within this agent's share"""
+        with self._lock:
+            self._unreported_bytes += nbytes
+            rate = self.rate
+            if not rate:
+                return
+            # Token bucket with one second of burst
+            now = time.monotonic()
+            self._bucket_time = max(self._bucket_time, now - 1.0) + nbytes / rate
+            delay = self._bucket_time - now
+        if delay > 0:
+            time.sleep(delay)
+
+    def file_done(self):
+        """Count a finished file for the next progress report"""
+        with self._lock:
+            self._unreported_files += 1
+
+    def claim(self, checksum: str, size: int, path: str) -> Optional[str]:
+        """Reserve content for upload; returns where it is already stored if another agent has it"""
+        if not self.dedup:
+            return None
+        response = self._post('/content/claim', {
+            'agent': self.agent_id, 'checksum': checksum, 'size': size, 'path': path,
+        })
+        if response and response.get('status') == 'exists':
+            return response['path']
+        # New content, or another agent is still uploading it: upload as well
+        return None
+
+    def commit(self, checksum: str, size: int, path: str):
+        """Record content as stored"""
+        if self.dedup:
+            self._post('/content/commit', {'agent': self.agent_id, 'checksum': checksum, 'size': size, 'path': path})
+
+    def abandon(self, checksum: str):
+        """Release a claim after a failed upload"""
+        if self.dedup:
+            self._post('/content/abandon', {'agent': self.agent_id, 'checksum': checksum})
+
+    def _heartbeat_loop(self, interval: float):
+        """Renew the lease, report progress and pick up the current bandwidth share"""
+        while not self._stop_event.wait(interval):
+            bytes_done, files_done = self._take_report()
+            response = self._post('/lease/renew', {'lease_id': self.lease_id, 'bytes': bytes_done, 'files': files_done})
+            if response is None:
+                continue
+
+            if response.get('error') == 'unknown lease':
+                # Lease expired (e.g. coordinator restart); ask again without stalling the transfer
+                response = self._post('/lease', {
+                    'agent': self.agent_id, 'session': self._session, 'total_bytes': self._total_bytes
+                })
+                if not response or not response.get('granted'):
+                    self.logger.warning("Ingest lease lost; continuing the current session")
+                    continue
+            self._adopt(response)
+
+    def _adopt(self, response: Dict[str, Any]):
+        """Take over lease id and rate from a grant"""
+        previous = self.rate
+        with self._lock:
+            self.lease_id = response['lease_id']
+            self.rate = response.get('rate')
+        if previous != self.rate and previous is not None:
+            self.logger.info(f"Bandwidth share changed{self._rate_text()}")
+
+    def _take_report(self) -> Tuple[int, int]:
+        """Bytes and files since the last report"""
+        with self._lock:
+            report = (self._unreported_bytes, self._unreported_files)
+            self._unreported_bytes = 0
+            self._unreported_files = 0
+            return report
+
+    def _rate_text(self) -> str:
+        return f" ({self.rate / (1024 * 1024):.1f} MB/s)" if self.rate else ""
+
+    def _post(self, path: str, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """POST to the coordinator; None when it cannot be reached"""
+        try:
+            response = requests.post(f"{self.url}{path}", json=payload, timeout=self.timeout)
+        except requests.RequestException as e:
+            self.logger.debug(f"Coordinator request {path} failed: {e}")
+            return None
+        if response.status_code == 404:
+            return {'error': 'unknown lease'}
+        if not response.ok:
+            self.logger.warning(f"Coordinator rejected {path}: {response.status_code} {response.text}")
+            return None
+        return response.json()
+
+
+def main():
+    """Run the fleet coordinator service"""
+    parser = argparse.ArgumentParser(description="Pickly Pi fleet coordinator")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--slots', type=int, default=2, help="Agents ingesting at the same time")
+    parser.add_argument('--bandwidth-mbps', type=float, default=0.0, help="Fleet bandwidth budget in MB/s (0 = unlimited)")
+    parser.add_argument('--lease-ttl', type=float, default=60, help="Seconds without heartbeat before a slot is reclaimed")
+    parser.add_argument('--db', default=':memory:', help="Content index database (persists dedup across restarts)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    coordinator = FleetCoordinator(
+        args.host, args.port, args.slots,
+        args.bandwidth_mbps * 1024 * 1024 if args.bandwidth_mbps else None,
+        args.lease_ttl, db_path=args.db
+    )
+    coordinator.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        coordinator.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+"""
+Transfer destinations (SMB shares and local backup drives)
+"""
+
+import os
+import uuid
+import logging
+from typing import Dict, Any, Iterator, List, Optional
+
+from smbprotocol.connection import Connection
+from smbprotocol.exceptions import (
+    SMBException, SMBResponseException, SMBConnectionClosed, UserSessionDeleted, NetworkNameDelegated
+)
+from smbprotocol.header import NtStatus
+from smbprotocol.session import Session
+from smbprotocol.tree import TreeConnect
+from smbprotocol.file_info import FileRenameInformation
+from smbprotocol.open import (
+    Open, CreateDisposition, CreateOptions, FileAttributes,
+    FilePipePrinterAccessMask, ImpersonationLevel, ShareAccess,
+    SMB2SetInfoRequest, SMB2SetInfoResponse
+)
+
+# Errors that leave the connection (and every open handle) unusable until reconnect.
+# NetworkNameDelegated is smbprotocol's name for STATUS_NETWORK_NAME_DELETED.
+CONNECTION_ERRORS = (ConnectionError, SMBConnectionClosed, UserSessionDeleted, NetworkNameDelegated)
+SESSION_LOST_STATUSES = {
+    NtStatus.STATUS_USER_SESSION_DELETED,
+    NtStatus.STATUS_NETWORK_NAME_DELETED,
+    0xC000035C,  # STATUS_NETWORK_SESSION_EXPIRED, not in smbprotocol's NtStatus
+}
+
+
+def is_connection_error(error: Exception) -> bool:
+    """True if the transport or session is gone, so a reconnect may help"""
+    if isinstance(error, CONNECTION_ERRORS):
+        return True
+    return isinstance(error, SMBResponseException) and error.status in SESSION_LOST_STATUSES
+
+
+def is_server_error(error: Exception) -> bool:
+    """True if the server refused a request (disk full, access denied, ...); retrying will not help"""
+    return isinstance(error, SMBException) and not is_connection_error(error)
+
+
+class SMBDestination:
+    """Transfer target on an SMB share"""
+
+    def __init__(self, name: str, smb_config: Dict[str, Any], base_path: str):
+        self.name = name
+        self.smb_config = smb_config
+        self.base_path = base_path.strip('/')
+        self.logger = logging.getLogger(__name__)
+
+        # Connection objects
+        self.connection = None
+        self.session = None
+        self.tree = None
+
+    def connect(self):
+        """Establish SMB connection"""
+        server = self.smb_config.get('server')
+        port = self.smb_config.get('port', 445)
+        username = self.smb_config.get('username')
+        password = self.smb_config.get('password')
+        domain = self.smb_config.get('domain', '')
+        share = self.smb_config.get('share')
+
+        self.logger.info(f"Connecting to SMB server {server}:{port} ({self.name})")
+
+        # Create connection
+        self.connection = Connection(uuid.uuid4(), server, port)
+        self.connection.connect()
+
+        # Create session
+        self.session = Session(self.connection, username, password, domain)
+        self.session.connect()
+
+        # Connect to tree (share)
+        self.tree = TreeConnect(self.session, f"\\\\{server}\\{share}")
+        self.tree.connect()
+
+        self.logger.info(f"SMB connection established ({self.name})")
+
+    def disconnect(self):
+        """Close SMB connection"""
+        try:
+            if self.tree:
+                self.tree.disconnect()
+            if self.session:
+                self.session.disconnect()
+            if self.connection:
+                self.connection.disconnect()
+
+            self.logger.info(f"SMB connection closed ({self.name})")
+
+        except Exception as e:
+            self.logger.error(f"Error disconnecting SMB ({self.name}): {e}")
+        finally:
+            self.connection = None
+            self.session = None
+            self.tree = None
+
+    def session_path(self, session_dir: str) -> str:
+        """Full path of a session directory on this destination"""
+        return f"{self.base_path}/{session_dir}" if self.base_path else session_dir
+
+    def create_directory(self, remote_path: str):
+        """Create directory on remote SMB share"""
+        # Create each path component; parents might not exist yet
+        parts = [part for part in remote_path.split('/') if part]
+        for depth in range(1, len(parts) + 1):
+            directory = Open(self.tree, '\\'.join(parts[:depth]))
+            try:
+                directory.create(
+                    ImpersonationLevel.Impersonation,
+                    FilePipePrinterAccessMask.GENERIC_READ | FilePipePrinterAccessMask.GENERIC_WRITE,
+                    FileAttributes.FILE_ATTRIBUTE_DIRECTORY,
+                    ShareAccess.FILE_SHARE_READ | ShareAccess.FILE_SHARE_WRITE,
+                    CreateDisposition.FILE_CREATE,
+                    CreateOptions.FILE_DIRECTORY_FILE
+                )
+                directory.close()
+
+            except Exception as e:
+                # Directory might already exist
+                if "object name already exists" not in str(e).lower():
+                    raise
+
+    def get_file_size(self, remote_path: str) -> Optional[int]:
+        """Return the size of a remote file, or None if it does not exist"""
+        remote_file = Open(self.tree, self._smb_path(remote_path))
+        try:
+            remote_file.create(
+                ImpersonationLevel.Impersonation,
+                FilePipePrinterAccessMask.FILE_READ_ATTRIBUTES,
+                FileAttributes.FILE_ATTRIBUTE_NORMAL,
+                ShareAccess.FILE_SHARE_READ,
+                CreateDisposition.FILE_OPEN,
+                CreateOptions.FILE_NON_DIRECTORY_FILE
+            )
+        except Exception:
+            # File doesn't exist or error accessing it
+            return None
+
+        try:
+            return remote_file.end_of_file
+        finally:
+            remote_file.close()
+
+    def open_for_write(self, remote_path: str):
+        """Create (or overwrite a partial) remote file for writing"""
+        remote_file = Open(self.tree, self._smb_path(remote_path))
+        remote_file.create(
+            ImpersonationLevel.Impersonation,
+            FilePipePrinterAccessMask.GENERIC_WRITE,
+            FileAttributes.FILE_ATTRIBUTE_NORMAL,
+            0,
+            CreateDisposition.FILE_OVERWRITE_IF,
+            CreateOptions.FILE_NON_DIRECTORY_FILE
+        )
+        return remote_file
+
+    def write(self, handle, data: bytes, offset: int):
+        """Write data at offset, splitting to the negotiated write size"""
+        max_write = self.connection.max_write_size
+        view = memoryview(data)
+        for start in range(0, len(data), max_write):
+            handle.write(view[start:start + max_write].tobytes(), offset + start)
+
+    def close(self, handle):
+        """Close a remote file handle"""
+        handle.close()
+
+    def rename(self, remote_path: str, new_path: str):
+        """Rename a remote file in place, replacing any existing target"""
+        remote_file = Open(self.tree, self._smb_path(remote_path))
+        remote_file.create(
+            ImpersonationLevel.Impersonation,
+            FilePipePrinterAccessMask.DELETE,
+            FileAttributes.FILE_ATTRIBUTE_NORMAL,
+            ShareAccess.FILE_SHARE_READ | ShareAccess.FILE_SHARE_WRITE | ShareAccess.FILE_SHARE_DELETE,
+            CreateDisposition.FILE_OPEN,
+            CreateOptions.FILE_NON_DIRECTORY_FILE
+        )
+
+        try:
+            rename_info = FileRenameInformation()
+            rename_info['replace_if_exists'] = True
+            rename_info['file_name'] = self._smb_path(new_path)
+
+            request = SMB2SetInfoRequest()
+            request['info_type'] = rename_info.INFO_TYPE
+            request['file_info_class'] = rename_info.INFO_CLASS
+            request['file_id'] = remote_file.file_id
+            request['buffer'] = rename_info
+
+            sent = self.connection.send(request, sid=self.session.session_id, tid=self.tree.tree_connect_id)
+            SMB2SetInfoResponse().unpack(self.connection.receive(sent)['data'].get_value())
+        finally:
+            remote_file.close()
+
+    def read_chunks(self, remote_path: str, chunk_size: int) -> Iterator[bytes]:
+        """Read a remote file back in chunks"""
+        remote_file = Open(self.tree, self._smb_path(remote_path))
+        remote_file.create(
+            ImpersonationLevel.Impersonation,
+            FilePipePrinterAccessMask.GENERIC_READ,
+            FileAttributes.FILE_ATTRIBUTE_NORMAL,
+            ShareAccess.FILE_SHARE_READ,
+            CreateDisposition.FILE_OPEN,
+            CreateOptions.FILE_NON_DIRECTORY_FILE
+        )
+
+        read_size = min(chunk_size, self.connection.max_read_size)
+        offset = 0
+        try:
+            while offset < remote_file.end_of_file:
+                chunk = remote_file.read(offset, min(read_size, remote_file.end_of_file - offset))
+                if not chunk:
+                    break
+                yield chunk
+                offset += len(chunk)
+        finally:
+            remote_file.close()
+
+    @staticmethod
+    def _smb_path(remote_path: str) -> str:
+        """Convert to SMB path format"""
+        return remote_path.replace('/', '\\')
+
+
+class LocalDestination:
+    """Transfer target on a locally mounted path (e.g. a USB backup drive)"""
+
+    def __init__(self, name: str, base_path: str):
+        self.name = name
+        self.base_path = base_path
+        self.logger = logging.getLogger(__name__)
+
+    def connect(self):
+        """Check the backup path is available"""
+        if not os.path.isdir(self.base_path):
+            raise FileNotFoundError(f"Destination path not found: {self.base_path}")
+
+    def disconnect(self):
+        """Nothing to release for local paths"""
+
+    def session_path(self, session_dir: str) -> str:
+        """Full path of a session directory on this destination"""
+        return os.path.join(self.base_path, session_dir)
+
+    def create_directory(self, path: str):
+        """Create directory on the local path"""
+        os.makedirs(path, exist_ok=True)
+
+    def get_file_size(self, path: str) -> Optional[int]:
+        """Return the size of a file, or None if it does not exist"""
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return None
+
+    def open_for_write(self, path: str):
+        """Create (or overwrite a partial) file for writing"""
+        return open(path, 'wb')
+
+    def write(self, handle, data: bytes, offset: int):
+        """Write data at offset"""
+        handle.seek(offset)
+        handle.write(data)
+
+    def close(self, handle):
+        """Flush to the device and close"""
+        try:
+            handle.flush()
+            os.fsync(handle.fileno())
+        finally:
+            handle.close()
+
+    def rename(self, path: str, new_path: str):
+        """Rename a file in place, replacing any existing target"""
+        os.replace(path, new_path)
+        directory = os.open(os.path.dirname(new_path) or '.', os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+    def read_chunks(self, path: str, chunk_size: int) -> Iterator[bytes]:
+        """Read a file back in chunks"""
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+
+def build_destinations(config) -> List:
+    """Build the primary SMB destination plus any configured extra targets"""
+    destinations = [
+        SMBDestination('primary', config.get_smb_config(), config.get_remote_base_path())
+    ]
+
+    for index, target in enumerate(config.get_destinations_config()):
+        name = target.get('name', f"destination{index + 1}")
+        target_type = target.get('type', 'smb')
+
+        if target_type == 'local':
+            destinations.append(LocalDestination(name, target['path']))
+        elif target_type == 'smb':
+            destinations.append(
+                SMBDestination(name, target, target.get('remote_base_path', config.get_remote_base_path()))
+            )
+        else:
+            raise ValueError(f"Unknown destination type for {name}: {target_type}")
+
+    return destinations
@@ -3,278 +3,783 @@ File transfer management via SMB
 """
 
 import os
-import hashlib
+import json
+import queue
+import threading
 import time
-import uuid
 import datetime
-from pathlib import Path
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple, Callable
 import logging
 
-from smbprotocol.connection import Connection
-from smbprotocol.session import Session
-from smbprotocol.tree import TreeConnect
-from smbprotocol.file import File, CreateDisposition, CreateOptions, FileAttributes
-from smbprotocol.open import Open
+from card_reader import CardReader
+from checksum import ChecksumEngine
+from coordinator import CoordinatorClient
+from pack import PackSegment, INDEX_SUFFIX, segment_name
+from destinations import build_destinations, is_connection_error, is_server_error
+from progress_server import TransferStatus
+from utils.profiling import StageTimings
 
 
 class FileTransferManager:
-    def __init__(self, config):
+    def __init__(self, config, progress=None):
         self.config = config
+        self.progress = progress
         self.logger = logging.getLogger(__name__)
-        self.smb_config = config.get_smb_config()
         self.transfer_config = config.get_transfer_config()
-        
-        # Connection objects
-        self.connection = None
-        self.session = None
-        self.tree = None
-        
-    def transfer_files(self, file_paths: List[str], source_card: str) -> int:
-        """Transfer files to SMB share"""
+        self.card_reader = CardReader(config)
+        self.checksums = ChecksumEngine(config)
+        self.timings = StageTimings()
+
+        # Optional fleet coordination (ingest slots, bandwidth share, cross-agent dedup)
+        self.coordinator = None
+        if config.get_coordinator_config().get('enabled', False):
+            self.coordinator = CoordinatorClient(config)
+            if self.coordinator.dedup and self.transfer_config.get('pack', {}).get('enabled', False):
+                self.logger.warning("Packed small files are not deduplicated across agents; only individual transfers are")
+
+        # Primary share first, followed by any redundant targets
+        self.destinations = build_destinations(config)
+        self.active_destinations = []
+
+        # Per-file results of the current session, written out as its manifest
+        self.manifest = {}
+        self.pack_count = 0
+        # Destinations whose server refused the current attempt (name -> error)
+        self.refused = {}
+
+    def transfer_files(self, file_paths: List[str], source_card: str, deferred: Optional[List[str]] = None,
+                       pairs: Optional[Dict[str, str]] = None) -> int:
+        """Transfer files to every destination, reading each file from the card once"""
+        # Deferred files are only read once every other file has landed
+        deferred = deferred or []
+        critical_count = len(file_paths)
+        file_paths = file_paths + deferred
         success_count = 0
-        
+        session_id = None
+        degraded = False
+        destination_counts = {destination.name: 0 for destination in self.destinations}
+        self.manifest = {}
+        self.pack_count = 0
+
         try:
-            self._connect_smb()
-            
+            if self.coordinator:
+                self.coordinator.acquire(os.path.basename(source_card.rstrip('/')), self._total_size(file_paths))
+
+            with self.timings.stage('connect'):
+                self._connect_smb()
+
             # Create session directory based on timestamp
             session_dir = self._create_session_directory(source_card)
-            
-            for file_path in file_paths:
+            session_id = session_dir
+
+            # Extra destinations are redundant copies, not a replacement for the primary share
+            degraded = self.destinations[0] not in self.active_destinations
+            if degraded:
+                self.logger.error(
+                    f"Primary share unreachable; session {session_dir} goes to "
+                    f"{', '.join(d.name for d in self.active_destinations)} only and is reported degraded"
+                )
+            self._publish_session_start(session_id, file_paths)
+
+            # Read in on-card order so the reader streams instead of seeking
+            batches = self._plan_batches(self.card_reader.order_files(file_paths[:critical_count]))
+            if deferred:
+                self.logger.info(f"Deferring {len(deferred)} files until {critical_count} others are transferred")
+                batches += self._plan_batches(self.card_reader.order_files(deferred))
+
+            for batch in batches:
                 try:
-                    if self._transfer_single_file(file_path, session_dir):
+                    if len(batch) > 1:
+                        outcomes = self._transfer_pack(batch, session_dir)
+                    else:
+                        outcomes = {batch[0]: self._transfer_claimed_file(batch[0], session_dir)}
+                except Exception as e:
+                    self.logger.error(f"Error transferring {', '.join(batch)}: {e}")
+                    for file_path in batch:
+                        self._publish_file_state(session_dir, file_path, TransferStatus.FAILED, error=str(e))
+                    continue
+
+                for file_path, results in outcomes.items():
+                    for name, ok in results.items():
+                        if ok:
+                            destination_counts[name] += 1
+
+                    if results and all(results.values()) and degraded:
+                        self.logger.warning(f"Transferred to additional destinations only: {file_path}")
+                    elif results and all(results.values()):
                         success_count += 1
                         self.logger.info(f"Successfully transferred: {file_path}")
                     else:
-                        self.logger.error(f"Failed to transfer: {file_path}")
-                        
-                except Exception as e:
-                    self.logger.error(f"Error transferring {file_path}: {e}")
-                    
+                        failed = [name for name, ok in results.items() if not ok]
+                        self.logger.error(f"Failed to transfer: {file_path} (destinations: {', '.join(failed)})")
+
+            self._record_pairs(file_paths, pairs or {})
+
+            if len(self.destinations) > 1:
+                for name, count in destination_counts.items():
+                    self.logger.info(f"Destination {name}: {count}/{len(file_paths)} files transferred")
+
+            self._write_manifest(session_dir, source_card)
+
+            if degraded:
+                self.logger.error(f"Session {session_dir} is degraded: no file reached the primary share")
+            if self.progress:
+                self.progress.session_finished(session_id, success_count, degraded=degraded)
+
         except Exception as e:
             self.logger.error(f"SMB connection error: {e}")
+            if self.progress and session_id:
+                self.progress.session_finished(session_id, success_count, failed=True)
         finally:
             self._disconnect_smb()
-            
+            self.checksums.shutdown()
+            if self.coordinator:
+                self.coordinator.release()
+
         return success_count
-        
-    def _connect_smb(self):
-        """Establish SMB connection"""
+
+    def _write_manifest(self, session_dir: str, source_card: str):
+        """Write the session manifest (files, digests and digest scheme) to every destination"""
+        manifest = {
+            'session': session_dir,
+            'source_card': source_card,
+            'checksum_scheme': self.checksums.scheme,
+            'files': self.manifest,
+        }
+        data = json.dumps(manifest, indent=2).encode('utf-8')
+
+        # The manifest marks the session complete on the server, so it gets the same retries as files
+        results = {destination.name: False for destination in self.active_destinations}
+        self._retry_destinations('manifest.json', results, list(self.active_destinations), lambda destinations, attempt: {
+            destination.name: self._write_atomic(
+                destination, f"{destination.session_path(session_dir)}/manifest.json", data
+            )
+            for destination in destinations
+        })
+
+    def _write_atomic(self, destination, remote_path: str, data: bytes) -> bool:
+        """Write a small file under a temporary name and rename it into place, so it never appears partial"""
+        temp_path = f"{remote_path}.tmp"
         try:
-            server = self.smb_config.get('server')
-            port = self.smb_config.get('port', 445)
-            username = self.smb_config.get('username')
-            password = self.smb_config.get('password')
-            domain = self.smb_config.get('domain', '')
-            share = self.smb_config.get('share')
-            
-            self.logger.info(f"Connecting to SMB server {server}:{port}")
-            
-            # Create connection
-            self.connection = Connection(uuid.uuid4(), server, port)
-            self.connection.connect()
-            
-            # Create session
-            self.session = Session(self.connection, username, password, domain)
-            self.session.connect()
-            
-            # Connect to tree (share)
-            self.tree = TreeConnect(self.session, f"\\\\{server}\\{share}")
-            self.tree.connect()
-            
-            self.logger.info("SMB connection established")
-            
+            handle = destination.open_for_write(temp_path)
+            try:
+                destination.write(handle, data, 0)
+            finally:
+                destination.close(handle)
+            destination.rename(temp_path, remote_path)
+            return True
         except Exception as e:
-            self.logger.error(f"Failed to connect to SMB: {e}")
-            raise
-            
+            self.logger.error(f"Failed to write {os.path.basename(remote_path)} on {destination.name}: {e}")
+            if is_server_error(e):
+                self.refused[destination.name] = e
+            return False
+
+    def _record_pairs(self, file_paths: List[str], pairs: Dict[str, str]):
+        """Link both halves of each transferred RAW+JPEG pair in the manifest"""
+        transferred = set(file_paths)
+        for file_path in file_paths:
+            partner = pairs.get(file_path)
+            entry = self.manifest.get(os.path.basename(file_path))
+            if partner in transferred and entry is not None:
+                entry['pair'] = os.path.basename(partner)
+
+    def _publish_session_start(self, session_id: str, file_paths: List[str]):
+        """Publish session start and mark all files as waiting"""
+        if not self.progress:
+            return
+
+        sizes = {}
+        for file_path in file_paths:
+            try:
+                sizes[file_path] = os.path.getsize(file_path)
+            except OSError:
+                sizes[file_path] = 0
+
+        self.progress.session_started(session_id, len(file_paths), sum(sizes.values()))
+        for file_path, size in sizes.items():
+            self.progress.file_state(
+                session_id, os.path.basename(file_path), TransferStatus.WAITING,
+                bytes_done=0, total_bytes=size
+            )
+
+    def _publish_file_state(self, session_dir: str, local_path: str, state: str, **fields):
+        """Publish a per-file state transition if progress events are enabled"""
+        if self.progress:
+            self.progress.file_state(session_dir, os.path.basename(local_path), state, **fields)
+
+    def _connect_smb(self):
+        """Connect every destination; unreachable targets are skipped (the caller reports a missing primary)"""
+        self.active_destinations = []
+
+        for destination in self.destinations:
+            try:
+                destination.connect()
+                self.active_destinations.append(destination)
+            except Exception as e:
+                self.logger.error(f"Failed to connect to destination {destination.name}: {e}")
+                destination.disconnect()
+
+        if not self.active_destinations:
+            raise ConnectionError("No transfer destination is reachable")
+
     def _disconnect_smb(self):
-        """Close SMB connection"""
-        try:
-            if self.tree:
-                self.tree.disconnect()
-            if self.session:
-                self.session.disconnect()
-            if self.connection:
-                self.connection.disconnect()
-                
-            self.logger.info("SMB connection closed")
-            
-        except Exception as e:
-            self.logger.error(f"Error disconnecting SMB: {e}")
-            
+        """Close all destination connections"""
+        for destination in self.active_destinations:
+            destination.disconnect()
+        self.active_destinations = []
+
+    def _reconnect(self, destination):
+        """Re-establish a destination connection after a failed attempt"""
+        destination.disconnect()
+        destination.connect()
+
     def _create_session_directory(self, source_card: str) -> str:
-        """Create a unique directory for this transfer session"""
+        """Create a unique directory for this transfer session on every destination"""
         # Extract card identifier (last part of path)
         card_name = os.path.basename(source_card.rstrip('/'))
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
         session_dir = f"{timestamp}_{card_name}"
-        
-        remote_base = self.config.get_remote_base_path().strip('/')
-        remote_session_path = f"{remote_base}/{session_dir}"
-        
-        try:
-            self._create_remote_directory(remote_session_path)
-            self.logger.info(f"Created session directory: {remote_session_path}")
-            return remote_session_path
-            
-        except Exception as e:
-            self.logger.error(f"Failed to create session directory: {e}")
-            raise
-            
-    def _create_remote_directory(self, remote_path: str):
-        """Create directory on remote SMB share"""
-        try:
-            # Convert to SMB path format
-            smb_path = remote_path.replace('/', '\\')
-            
-            file_handle = File(self.tree, smb_path)
-            open_info = file_handle.create(
-                CreateDisposition.FILE_CREATE,
-                CreateOptions.FILE_DIRECTORY_FILE,
-                FileAttributes.FILE_ATTRIBUTE_DIRECTORY
+
+        for destination in list(self.active_destinations):
+            remote_session_path = destination.session_path(session_dir)
+            try:
+                destination.create_directory(remote_session_path)
+                self.logger.info(f"Created session directory: {remote_session_path} ({destination.name})")
+
+            except Exception as e:
+                self.logger.error(f"Failed to create session directory on {destination.name}: {e}")
+                if len(self.active_destinations) == 1:
+                    raise
+                self.active_destinations.remove(destination)
+                destination.disconnect()
+
+        return session_dir
+
+    def _plan_batches(self, ordered_paths: List[str]) -> List[List[str]]:
+        """Split the files into single transfers and runs of small files packed into one segment"""
+        pack_config = self.transfer_config.get('pack', {})
+        if not pack_config.get('enabled', False):
+            return [[file_path] for file_path in ordered_paths]
+
+        max_file_size = pack_config.get('max_file_size', 4194304)
+        segment_size = pack_config.get('segment_size', 67108864)
+
+        batches = []
+        run = []
+        run_bytes = 0
+        for file_path in ordered_paths:
+            try:
+                size = os.path.getsize(file_path)
+            except OSError:
+                size = None
+            if size is None or size > max_file_size:
+                batches.append([file_path])
+                continue
+
+            run.append(file_path)
+            run_bytes += size
+            if run_bytes >= segment_size:
+                batches.append(run)
+                run = []
+                run_bytes = 0
+
+        # The leftover run is packed like any other; transfer_files sends a batch of
+        # one file as itself, since a single small file gains nothing from packing
+        if run:
+            batches.append(run)
+        return batches
+
+    def _transfer_claimed_file(self, file_path: str, session_dir: str) -> Dict[str, bool]:
+        """Transfer one file, deduplicating it against the fleet when coordinated"""
+        checksum, duplicate_of = self._claim_content(file_path, session_dir)
+        results = self._transfer_single_file(file_path, session_dir, checksum, duplicate_of)
+        self.manifest.setdefault(os.path.basename(file_path), {})['destinations'] = results
+        self._settle_content(file_path, session_dir, checksum, duplicate_of, results)
+        return results
+
+    def _transfer_pack(self, file_paths: List[str], session_dir: str) -> Dict[str, Dict[str, bool]]:
+        """Transfer a run of small files as one pack segment with retry logic, tracked per destination"""
+        self.pack_count += 1
+        segment = PackSegment(
+            segment_name(self.pack_count), file_paths, self.transfer_config.get('chunk_size', 1048576)
+        )
+
+        results = {destination.name: False for destination in self.active_destinations}
+        pending = self._retry_destinations(
+            segment.name, results, list(self.active_destinations),
+            lambda destinations, attempt: self._do_pack_transfer(segment, session_dir, destinations)
+        )
+
+        # Members share the outcome of their segment
+        entries = {entry['name']: entry for entry in segment.entries}
+        outcomes = {}
+        for file_path in file_paths:
+            filename = os.path.basename(file_path)
+            entry = entries.get(filename, {})
+            self.manifest[filename] = {
+                'size': entry['size'] if 'size' in entry else os.path.getsize(file_path),
+                'checksum': entry.get('checksum'),
+                'pack': segment.name,
+                'destinations': dict(results),
+            }
+            if self.coordinator:
+                self.coordinator.file_done()
+
+            if pending:
+                self._publish_file_state(session_dir, file_path, TransferStatus.FAILED, destinations=results)
+            else:
+                self._publish_file_state(session_dir, file_path, TransferStatus.SUCCESS, destinations=results)
+            outcomes[file_path] = dict(results)
+        return outcomes
+
+    def _transfer_single_file(self, local_path: str, session_dir: str, checksum: Optional[str] = None,
+                              duplicate_of: Optional[str] = None) -> Dict[str, bool]:
+        """Transfer a single file with retry logic, tracked per destination"""
+        results = {destination.name: False for destination in self.active_destinations}
+        pending = list(self.active_destinations)
+
+        # Another agent already stored this content on the shared primary share
+        if duplicate_of and self.destinations[0] in pending:
+            pending.remove(self.destinations[0])
+            results[self.destinations[0].name] = True
+            self.manifest[os.path.basename(local_path)] = {
+                'size': os.path.getsize(local_path), 'checksum': checksum, 'duplicate_of': duplicate_of,
+            }
+            self.logger.info(f"Content already stored by another agent: {os.path.basename(local_path)} -> {duplicate_of}")
+            if not pending:
+                self._publish_file_state(session_dir, local_path, TransferStatus.DUPLICATE, duplicate_of=duplicate_of)
+                return results
+
+        # A file that failed verification has the right size, so the
+        # size-based duplicate check is only trusted on the first attempt
+        pending = self._retry_destinations(local_path, results, pending, lambda destinations, attempt: (
+            self._do_file_transfer(
+                local_path, session_dir, destinations, check_duplicates=(attempt == 0), known_checksum=checksum
             )
-            file_handle.close()
-            
-        except Exception as e:
-            # Directory might already exist
-            if "object name already exists" not in str(e).lower():
-                raise
-                
-    def _transfer_single_file(self, local_path: str, remote_session_dir: str) -> bool:
-        """Transfer a single file with retry logic"""
+        ))
+
+        if pending:
+            self._publish_file_state(session_dir, local_path, TransferStatus.FAILED, destinations=results)
+        return results
+
+    def _retry_destinations(self, label: str, results: Dict[str, bool], pending: List,
+                            attempt_transfer: Callable[[List, int], Dict[str, bool]]) -> List:
+        """Run transfer attempts until every destination succeeded; returns those still failing"""
         max_retries = self.transfer_config.get('max_retries', 3)
         retry_delay = self.transfer_config.get('retry_delay', 5)
-        
+        refused = []
+
         for attempt in range(max_retries):
+            self.refused = {}
             try:
-                return self._do_file_transfer(local_path, remote_session_dir)
-                
+                results.update(attempt_transfer(pending, attempt))
             except Exception as e:
-                self.logger.warning(f"Transfer attempt {attempt + 1} failed for {local_path}: {e}")
-                
-                if attempt < max_retries - 1:
-                    time.sleep(retry_delay)
-                else:
-                    self.logger.error(f"All {max_retries} transfer attempts failed for {local_path}")
-                    
-        return False
-        
-    def _do_file_transfer(self, local_path: str, remote_session_dir: str) -> bool:
-        """Perform the actual file transfer"""
+                self.logger.warning(f"Transfer attempt {attempt + 1} failed for {label}: {e}")
+
+            # Only destinations that failed are retried, unless their server refused the data
+            failed = [destination for destination in pending if not results[destination.name]]
+            for destination in failed:
+                if destination.name in self.refused:
+                    self.logger.error(
+                        f"{destination.name} refused {label}: {self.refused[destination.name]}; not retrying"
+                    )
+                    refused.append(destination)
+            pending = [destination for destination in failed if destination not in refused]
+            if not pending:
+                break
+
+            names = ', '.join(destination.name for destination in pending)
+            if attempt < max_retries - 1:
+                self.logger.warning(f"Transfer attempt {attempt + 1} failed for {label} on: {names}")
+                time.sleep(retry_delay)
+                for destination in pending:
+                    try:
+                        self._reconnect(destination)
+                    except Exception as e:
+                        self.logger.warning(f"Reconnect to {destination.name} failed: {e}")
+            else:
+                self.logger.error(f"All {max_retries} transfer attempts failed for {label} on: {names}")
+
+        return pending + refused
+
+    def _do_file_transfer(self, local_path: str, session_dir: str, destinations: List,
+                          check_duplicates: bool = True, known_checksum: Optional[str] = None) -> Dict[str, bool]:
+        """Read the file once and fan each chunk out to all destinations"""
         filename = os.path.basename(local_path)
-        remote_file_path = f"{remote_session_dir}/{filename}".replace('/', '\\')
-        
-        chunk_size = self.transfer_config.get('chunk_size', 1048576)
+
         verify_checksums = self.transfer_config.get('verify_checksums', True)
-        
+        queue_depth = self.transfer_config.get('fanout_queue_depth', 4)
+
+        results = {}
+        writers = []
+
+        # Check if file already exists and skip if duplicate
+        for destination in destinations:
+            remote_file_path = f"{destination.session_path(session_dir)}/{filename}"
+            is_duplicate = False
+            if check_duplicates:
+                with self.timings.stage('duplicate_check'):
+                    is_duplicate = self._check_duplicate_file(destination, local_path, remote_file_path)
+            if is_duplicate:
+                self.logger.info(f"File already exists (duplicate) on {destination.name}: {filename}")
+                results[destination.name] = True
+            else:
+                writers.append(_DestinationWriter(
+                    self, destination, local_path, remote_file_path, queue_depth, verify_checksums
+                ))
+
+        if not writers:
+            self._publish_file_state(session_dir, local_path, TransferStatus.DUPLICATE)
+            return results
+
+        for writer in writers:
+            writer.start()
+
+        transferred = 0
         try:
-            # Check if file already exists and skip if duplicate
-            if self._check_duplicate_file(local_path, remote_file_path):
-                self.logger.info(f"File already exists (duplicate): {filename}")
-                return True
-                
-            # Open local file
-            with open(local_path, 'rb') as local_file:
-                # Create remote file
-                remote_file = File(self.tree, remote_file_path)
-                file_handle = remote_file.create(
-                    CreateDisposition.FILE_CREATE,
-                    CreateOptions.FILE_NON_DIRECTORY_FILE,
-                    FileAttributes.FILE_ATTRIBUTE_NORMAL
-                )
-                
-                try:
-                    # Transfer file in chunks
-                    total_size = os.path.getsize(local_path)
-                    transferred = 0
-                    local_hash = hashlib.sha256() if verify_checksums else None
-                    
-                    while True:
-                        chunk = local_file.read(chunk_size)
-                        if not chunk:
-                            break
-                            
-                        remote_file.write(chunk, transferred)
-                        transferred += len(chunk)
-                        
-                        if local_hash:
-                            local_hash.update(chunk)
-                            
-                        # Log progress for large files
-                        if total_size > 10 * 1024 * 1024:  # 10MB
-                            progress = (transferred / total_size) * 100
-                            if transferred % (5 * 1024 * 1024) == 0:  # Every 5MB
-                                self.logger.info(f"Transfer progress for {filename}: {progress:.1f}%")
-                                
-                    # Verify transfer if enabled
-                    if verify_checksums and not self._verify_transfer(
-                        local_path, remote_file_path, local_hash.hexdigest()
-                    ):
-                        return False
-                        
-                    self.logger.info(f"Transfer completed: {filename} ({transferred} bytes)")
-                    return True
-                    
-                finally:
-                    remote_file.close()
-                    
+            # Transfer file in chunks
+            total_size = os.path.getsize(local_path)
+            # Content already hashed for deduplication is not hashed again
+            local_hash = self.checksums.new() if verify_checksums and not known_checksum else None
+            self._publish_file_state(
+                session_dir, local_path, TransferStatus.TRANSFERRING,
+                bytes_done=0, total_bytes=total_size
+            )
+
+            for chunk in self.timings.timed('card_read', self.card_reader.read_chunks(local_path)):
+                # Blocks on the slowest destination instead of buffering unboundedly
+                with self.timings.stage('fanout_wait'):
+                    for writer in writers:
+                        writer.put(chunk, transferred)
+                transferred += len(chunk)
+
+                if self.coordinator:
+                    self.coordinator.throttle(len(chunk))
+
+                if local_hash:
+                    with self.timings.stage('hash', len(chunk)):
+                        local_hash.update(chunk)
+
+                if self.progress:
+                    self.progress.file_progress(session_dir, filename, transferred, total_size)
+
+                # Log progress for large files
+                if total_size > 10 * 1024 * 1024:  # 10MB
+                    progress = (transferred / total_size) * 100
+                    if transferred % (5 * 1024 * 1024) == 0:  # Every 5MB
+                        self.logger.info(f"Transfer progress for {filename}: {progress:.1f}%")
+
+            if verify_checksums:
+                self._publish_file_state(session_dir, local_path, TransferStatus.VERIFYING)
+
+            local_checksum = known_checksum or (local_hash.hexdigest() if local_hash else None)
+            self.manifest.setdefault(filename, {}).update({'size': total_size, 'checksum': local_checksum})
+
+            for writer in writers:
+                writer.finish(local_checksum)
+
         except Exception as e:
             self.logger.error(f"File transfer failed for {local_path}: {e}")
-            return False
-            
-    def _check_duplicate_file(self, local_path: str, remote_path: str) -> bool:
-        """Check if file already exists on remote share"""
+            for writer in writers:
+                writer.abort()
+
+        for writer in writers:
+            writer.join()
+            results[writer.destination.name] = writer.succeeded
+            if writer.succeeded:
+                self.logger.info(f"Transfer completed: {filename} ({transferred} bytes) to {writer.destination.name}")
+
+        if all(results.values()):
+            self._publish_file_state(session_dir, local_path, TransferStatus.SUCCESS, destinations=results)
+        return results
+
+    def _do_pack_transfer(self, segment: PackSegment, session_dir: str, destinations: List) -> Dict[str, bool]:
+        """Read a run of small files once and fan the packed segment out to all destinations"""
+        verify_checksums = self.transfer_config.get('verify_checksums', True)
+        queue_depth = self.transfer_config.get('fanout_queue_depth', 4)
+
+        writers = [
+            _PackWriter(
+                self, destination, segment.name, f"{destination.session_path(session_dir)}/{segment.name}",
+                queue_depth, verify_checksums
+            )
+            for destination in destinations
+        ]
+        for writer in writers:
+            writer.start()
+
+        transferred = 0
         try:
-            remote_file = File(self.tree, remote_path)
-            
-            # Try to get file info
-            info = remote_file.query_info()
-            if info:
-                # Compare file sizes
-                local_size = os.path.getsize(local_path)
-                remote_size = info['end_of_file'].get_value()
-                
-                if local_size == remote_size:
-                    self.logger.info(f"Duplicate file detected: {os.path.basename(local_path)}")
-                    return True
-                    
+            chunks = segment.chunks(
+                lambda path: self.timings.timed('card_read', self.card_reader.read_chunks(path)),
+                self.checksums.new if verify_checksums else None,
+                lambda path: self._publish_file_state(session_dir, path, TransferStatus.TRANSFERRING),
+                self.timings,
+            )
+            for chunk in chunks:
+                # Blocks on the slowest destination instead of buffering unboundedly
+                with self.timings.stage('fanout_wait'):
+                    for writer in writers:
+                        writer.put(chunk, transferred)
+                transferred += len(chunk)
+
+                if self.coordinator:
+                    self.coordinator.throttle(len(chunk))
+
+            if verify_checksums:
+                for file_path in segment.file_paths:
+                    self._publish_file_state(session_dir, file_path, TransferStatus.VERIFYING)
+
+            for writer in writers:
+                writer.finish(segment.index(self.checksums.scheme))
+
+        except Exception as e:
+            self.logger.error(f"Pack transfer failed for {segment.name}: {e}")
+            for writer in writers:
+                writer.abort()
+
+        results = {}
+        for writer in writers:
+            writer.join()
+            results[writer.destination.name] = writer.succeeded
+            if writer.succeeded:
+                self.logger.info(
+                    f"Transfer completed: {segment.name} ({len(segment.file_paths)} files, "
+                    f"{transferred} bytes) to {writer.destination.name}"
+                )
+        return results
+
+    def _total_size(self, file_paths: List[str]) -> int:
+        """Bytes to ingest in a session"""
+        total = 0
+        for file_path in file_paths:
+            try:
+                total += os.path.getsize(file_path)
+            except OSError:
+                pass
+        return total
+
+    def _claim_content(self, local_path: str, session_dir: str) -> Tuple[Optional[str], Optional[str]]:
+        """Hash a file up front and ask the coordinator whether another agent already stored it"""
+        if not (self.coordinator and self.coordinator.dedup):
+            return None, None
+
+        # Pages stay cached so the transfer pass reads from memory, not the card
+        with self.timings.stage('prehash', os.path.getsize(local_path)):
+            content_hash = self.checksums.new()
+            for chunk in self.card_reader.read_chunks(local_path, keep_cache=True):
+                content_hash.update(chunk)
+            checksum = content_hash.hexdigest()
+
+        remote_path = f"{self.destinations[0].session_path(session_dir)}/{os.path.basename(local_path)}"
+        return checksum, self.coordinator.claim(checksum, os.path.getsize(local_path), remote_path)
+
+    def _settle_content(self, local_path: str, session_dir: str, checksum: Optional[str],
+                        duplicate_of: Optional[str], results: Dict[str, bool]):
+        """Report the primary share outcome of a claimed file to the coordinator"""
+        if not self.coordinator:
+            return
+        self.coordinator.file_done()
+        if not checksum or duplicate_of:
+            return
+
+        if results.get(self.destinations[0].name):
+            remote_path = f"{self.destinations[0].session_path(session_dir)}/{os.path.basename(local_path)}"
+            self.coordinator.commit(checksum, os.path.getsize(local_path), remote_path)
+        else:
+            self.coordinator.abandon(checksum)
+
+    def _check_duplicate_file(self, destination, local_path: str, remote_path: str) -> bool:
+        """Check if file already exists on a destination"""
+        try:
+            remote_size = destination.get_file_size(remote_path)
+
+            # Compare file sizes
+            if remote_size is not None and remote_size == os.path.getsize(local_path):
+                self.logger.info(f"Duplicate file detected: {os.path.basename(local_path)}")
+                return True
+
         except Exception:
             # File doesn't exist or error accessing it
             pass
-            
+
         return False
-        
-    def _verify_transfer(self, local_path: str, remote_path: str, local_checksum: str) -> bool:
+
+    def _verify_transfer(self, destination, local_path: str, remote_path: str, local_checksum: str) -> bool:
         """Verify transferred file integrity"""
         try:
             # Read remote file and calculate checksum
-            remote_file = File(self.tree, remote_path)
-            file_handle = remote_file.open()
-            
-            remote_hash = hashlib.sha256()
+            remote_hash = self.checksums.new()
             chunk_size = self.transfer_config.get('chunk_size', 1048576)
-            offset = 0
-            
-            try:
-                while True:
-                    chunk = remote_file.read(chunk_size, offset)
-                    if not chunk:
+
+            for chunk in destination.read_chunks(remote_path, chunk_size):
+                remote_hash.update(chunk)
+
+            remote_checksum = remote_hash.hexdigest()
+
+            if local_checksum == remote_checksum:
+                return True
+            else:
+                self.logger.error(f"Checksum mismatch for {os.path.basename(local_path)} on {destination.name}")
+                return False
+
+        except Exception as e:
+            self.logger.error(f"Verification failed for {local_path} on {destination.name}: {e}")
+            return False
+
+    def _verify_pack(self, destination, remote_path: str, index: Dict) -> bool:
+        """Verify a pack segment in one read, checking every member against its own digest"""
+        try:
+            entries = index['files']
+            member_hashes = [self.checksums.new() for _ in entries]
+            chunk_size = self.transfer_config.get('chunk_size', 1048576)
+
+            position = 0
+            current = 0
+            for chunk in destination.read_chunks(remote_path, chunk_size):
+                view = memoryview(chunk)
+                end = position + len(chunk)
+                # Feed the part of each member that falls inside this chunk to its hash
+                while current < len(entries):
+                    entry = entries[current]
+                    member_end = entry['offset'] + entry['size']
+                    start = max(entry['offset'], position)
+                    if start >= end and entry['size']:
                         break
-                    remote_hash.update(chunk)
-                    offset += len(chunk)
-                    
-                remote_checksum = remote_hash.hexdigest()
-                
-                if local_checksum == remote_checksum:
-                    return True
-                else:
-                    self.logger.error(f"Checksum mismatch for {os.path.basename(local_path)}")
+                    if member_end > start:
+                        member_hashes[current].update(view[start - position:min(member_end, end) - position])
+                    if member_end > end:
+                        break
+                    current += 1
+                position = end
+
+            if position != index['size']:
+                self.logger.error(f"Size mismatch for {index['segment']} on {destination.name}")
+                return False
+
+            for entry, member_hash in zip(entries, member_hashes):
+                if member_hash.hexdigest() != entry['checksum']:
+                    self.logger.error(f"Checksum mismatch for {entry['name']} in {index['segment']} on {destination.name}")
                     return False
-                    
-            finally:
-                remote_file.close()
-                
+            return True
+
+        except Exception as e:
+            self.logger.error(f"Verification failed for {index['segment']} on {destination.name}: {e}")
+            return False
+
+    def _write_pack_index(self, destination, remote_path: str, index: Dict) -> bool:
+        """Write the segment index; its presence tells the unpacker the segment is complete"""
+        return self._write_atomic(destination, f"{remote_path}{INDEX_SUFFIX}", json.dumps(index, indent=2).encode('utf-8'))
+
+
+class _DestinationWriter(threading.Thread):
+    """Writes the chunks of one file to one destination from a bounded queue"""
+
+    def __init__(self, manager: FileTransferManager, destination, local_path: str,
+                 remote_path: str, queue_depth: int, verify: bool):
+        super().__init__(name=f"fanout-{destination.name}", daemon=True)
+        self.manager = manager
+        self.destination = destination
+        self.local_path = local_path
+        self.remote_path = remote_path
+        self.verify = verify
+        self.queue = queue.Queue(maxsize=max(queue_depth, 1))
+        self.failed = False
+        self.succeeded = False
+
+    def put(self, chunk: bytes, offset: int):
+        """Queue a chunk, blocking while this destination is behind"""
+        self.queue.put(('chunk', chunk, offset))
+
+    def finish(self, local_checksum: Optional[str]):
+        """Signal end of file along with the checksum to verify against"""
+        self.queue.put(('finish', local_checksum, None))
+
+    def abort(self):
+        """Signal that reading the source file failed"""
+        self.queue.put(('abort', None, None))
+
+    def run(self):
+        """Write queued chunks, then close and verify"""
+        logger = self.manager.logger
+        handle = None
+
+        try:
+            handle = self.destination.open_for_write(self.remote_path)
         except Exception as e:
-            self.logger.error(f"Verification failed for {local_path}: {e}")
-            return False
\ No newline at end of file
+            logger.error(f"Cannot create {self.remote_path} on {self.destination.name}: {e}")
+            self.failed = True
+            self._note_refusal(e)
+
+        while True:
+            kind, payload, offset = self.queue.get()
+
+            if kind == 'chunk':
+                # Keep draining after a failure so the card reader is never blocked
+                if not self.failed:
+                    self._write_with_retry(handle, payload, offset)
+                continue
+
+            if handle is not None:
+                try:
+                    self.destination.close(handle)
+                except Exception as e:
+                    logger.error(f"Error closing {self.remote_path} on {self.destination.name}: {e}")
+                    self.failed = True
+
+            if kind == 'finish' and not self.failed:
+                self.succeeded = self._complete(payload)
+            return
+
+    def _complete(self, local_checksum: Optional[str]) -> bool:
+        """Verify the closed file if enabled"""
+        with self.manager.timings.stage(f"verify:{self.destination.name}"):
+            return not self.verify or self.manager._verify_transfer(
+                self.destination, self.local_path, self.remote_path, local_checksum
+            )
+
+    def _write_with_retry(self, handle, data: bytes, offset: int):
+        """Write a chunk, retrying in place without re-reading the card"""
+        max_retries = self.manager.transfer_config.get('max_retries', 3)
+        retry_delay = self.manager.transfer_config.get('retry_delay', 5)
+
+        for attempt in range(max_retries):
+            try:
+                with self.manager.timings.stage(f"write:{self.destination.name}", len(data)):
+                    self.destination.write(handle, data, offset)
+                return
+            except Exception as e:
+                if is_connection_error(e):
+                    # The handle died with the connection; the file is retried after a reconnect
+                    self.manager.logger.warning(
+                        f"Connection lost writing {self.remote_path} on {self.destination.name}: {e}"
+                    )
+                    break
+                if is_server_error(e):
+                    # Disk full, access denied and the like fail the same way on every retry
+                    self._note_refusal(e)
+                    break
+                self.manager.logger.warning(
+                    f"Write attempt {attempt + 1} failed for {self.remote_path} on {self.destination.name}: {e}"
+                )
+                if attempt < max_retries - 1:
+                    time.sleep(retry_delay)
+
+        self.failed = True
+
+    def _note_refusal(self, error: Exception):
+        """Keep the file-level retry from reconnecting for an error the server will repeat"""
+        if is_server_error(error):
+            self.manager.refused[self.destination.name] = error
+
+
+class _PackWriter(_DestinationWriter):
+    """Writes one pack segment to one destination, then verifies it and publishes its index"""
+
+    def _complete(self, index: Dict) -> bool:
+        """Verify every member in a single read-back, then write the index"""
+        if self.verify:
+            with self.manager.timings.stage(f"verify:{self.destination.name}"):
+                if not self.manager._verify_pack(self.destination, self.remote_path, index):
+                    return False
+        return self.manager._write_pack_index(self.destination, self.remote_path, index)
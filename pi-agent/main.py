@@ -14,7 +14,9 @@ from pathlib import Path
 from config_manager import ConfigManager
 from sd_monitor import SDCardMonitor
 from file_transfer import FileTransferManager
+from progress_server import ProgressEventServer
 from utils.logger import setup_logging
+from utils.profiling import AgentProfiler
 
 
 class PicklyPiAgent:
@@ -25,12 +27,19 @@ class PicklyPiAgent:
         
         # Initialize components
         self.sd_monitor = SDCardMonitor(self.config)
-        self.transfer_manager = FileTransferManager(self.config)
+        self.progress_server = None
+        if self.config.get_progress_config().get('enabled', False):
+            self.progress_server = ProgressEventServer(self.config)
+        self.transfer_manager = FileTransferManager(self.config, progress=self.progress_server)
         
         # Setup signal handlers
         signal.signal(signal.SIGINT, self._signal_handler)
         signal.signal(signal.SIGTERM, self._signal_handler)
         
+        # SIGUSR1/SIGUSR2 introspection for slow transfers in the field
+        self.profiler = AgentProfiler(self.config, self.transfer_manager.timings)
+        self.profiler.install()
+        
     def _signal_handler(self, signum, frame):
         """Handle shutdown signals gracefully"""
         self.logger.info(f"Received signal {signum}, shutting down...")
@@ -41,6 +50,9 @@ class PicklyPiAgent:
         self.logger.info("Starting Pickly Pi Agent...")
         self.running = True
         
+        if self.progress_server:
+            self.progress_server.start()
+            
         try:
             while self.running:
                 # Check for new SD cards
@@ -77,19 +89,31 @@ class PicklyPiAgent:
             
         self.logger.info(f"Found {len(photo_files)} photo files")
         
+        # Pair RAW+JPEG files and apply the configured policy
+        critical_files, deferred_files, pairs = self.sd_monitor.plan_transfer(photo_files)
+        
         # Transfer files to server
         success_count = self.transfer_manager.transfer_files(
-            photo_files, 
-            card_path
+            critical_files, 
+            card_path,
+            deferred=deferred_files,
+            pairs=pairs
         )
         
-        self.logger.info(f"Successfully transferred {success_count}/{len(photo_files)} files")
+        self.logger.info(f"Successfully transferred {success_count}/{len(critical_files) + len(deferred_files)} files")
         
         # TODO: Optional SD card cleanup/formatting in later phases
         
     def stop(self):
         """Stop the agent"""
         self.running = False
+        
+        if self.progress_server:
+            self.progress_server.stop()
+            self.progress_server = None
+            
+        self.profiler.shutdown()
+            
         self.logger.info("Pickly Pi Agent stopped")
 
 
@@ -0,0 +1,93 @@
+"""
+Pack segments: runs of small files streamed to the share as one tar archive
+"""
+
+import os
+import tarfile
+from typing import List, Dict, Any, Callable, Iterable, Iterator, Optional
+
+from utils.profiling import StageTimings
+
+SEGMENT_PREFIX = 'pack-'
+INDEX_SUFFIX = '.index.json'
+
+
+def segment_name(number: int) -> str:
+    """Remote file name of the n-th pack segment of a session"""
+    return f"{SEGMENT_PREFIX}{number:04d}.tar"
+
+
+class PackSegment:
+    """A run of small files written as plain tar, with a byte-offset index of its members"""
+
+    def __init__(self, name: str, file_paths: List[str], chunk_size: int = 1048576):
+        self.name = name
+        self.file_paths = file_paths
+        self.chunk_size = chunk_size
+        self.entries: List[Dict[str, Any]] = []
+        self.size = 0
+
+    def chunks(self, read_chunks: Callable[[str], Iterable[bytes]], new_hash: Optional[Callable] = None,
+               on_file: Optional[Callable[[str], None]] = None,
+               timings: Optional[StageTimings] = None) -> Iterator[bytes]:
+        """Stream headers, file data and padding, coalesced into chunk_size writes"""
+        self.entries = []
+        buffer = bytearray()
+        offset = 0
+
+        for path in self.file_paths:
+            stat = os.stat(path)
+            info = tarfile.TarInfo(os.path.basename(path))
+            info.size = stat.st_size
+            info.mtime = int(stat.st_mtime)
+            info.mode = 0o644
+            header = info.tobuf(format=tarfile.PAX_FORMAT)
+
+            buffer += header
+            offset += len(header)
+            entry = {'name': info.name, 'offset': offset, 'size': info.size, 'mtime': stat.st_mtime}
+            file_hash = new_hash() if new_hash else None
+            if on_file:
+                on_file(path)
+
+            read = 0
+            for chunk in read_chunks(path):
+                read += len(chunk)
+                if file_hash:
+                    if timings:
+                        with timings.stage('hash', len(chunk)):
+                            file_hash.update(chunk)
+                    else:
+                        file_hash.update(chunk)
+                buffer += chunk
+                while len(buffer) >= self.chunk_size:
+                    yield bytes(buffer[:self.chunk_size])
+                    del buffer[:self.chunk_size]
+
+            # A file that changed size mid-read would shift every later member
+            if read != info.size:
+                raise IOError(f"{path} changed size while packing ({info.size} -> {read} bytes)")
+
+            padding = -read % tarfile.BLOCKSIZE
+            buffer += bytes(padding)
+            offset += read + padding
+            entry['checksum'] = file_hash.hexdigest() if file_hash else None
+            self.entries.append(entry)
+
+        # End-of-archive marker: two zero blocks
+        buffer += bytes(2 * tarfile.BLOCKSIZE)
+        offset += 2 * tarfile.BLOCKSIZE
+        self.size = offset
+
+        while buffer:
+            yield bytes(buffer[:self.chunk_size])
+            del buffer[:self.chunk_size]
+
+    def index(self, checksum_scheme: str) -> Dict[str, Any]:
+        """Index written next to the segment once it has been verified"""
+        return {
+            'segment': self.name,
+            'size': self.size,
+            'checksum_scheme': checksum_scheme,
+            'files': self.entries,
+        }
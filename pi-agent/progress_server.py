@@ -0,0 +1,291 @@
+"""
+Real-time transfer progress event stream (Server-Sent Events)
+"""
+
+import json
+import queue
+import threading
+import time
+import logging
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List, Optional, Tuple
+
+
+class TransferStatus:
+    """Per-file transfer states (mirrors shared.constants.TransferStatus)"""
+    WAITING = "waiting"
+    TRANSFERRING = "transferring"
+    VERIFYING = "verifying"
+    SUCCESS = "success"
+    FAILED = "failed"
+    DUPLICATE = "duplicate"
+    SKIPPED = "skipped"
+
+
+class SessionStatus:
+    """Per-session states"""
+    STARTED = "started"
+    COMPLETED = "completed"
+    DEGRADED = "degraded"
+    FAILED = "failed"
+
+
+class ProgressEventServer:
+    """Publishes session and file state changes to local SSE clients.
+
+    Publishing only records the latest state per session/file; a broadcaster
+    thread flushes the changed entries to clients at a fixed frame rate, so
+    the transfer loop never blocks on slow or numerous clients.
+    """
+
+    CLIENT_QUEUE_SIZE = 32
+    HEARTBEAT_INTERVAL = 15
+
+    def __init__(self, config):
+        self.config = config
+        self.logger = logging.getLogger(__name__)
+        self.progress_config = config.get_progress_config()
+
+        self.host = self.progress_config.get('host', '127.0.0.1')
+        self.port = self.progress_config.get('port', 8765)
+        self.frame_interval = 1.0 / max(self.progress_config.get('frame_rate', 10), 1)
+        self.retain_sessions = max(self.progress_config.get('retain_sessions', 10), 0)
+
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple[str, Optional[str]], Dict[str, Any]] = {}
+        self._snapshot: Dict[Tuple[str, Optional[str]], Dict[str, Any]] = {}
+        self._clients: List[queue.Queue] = []
+        self._sequence = 0
+        self._finished: deque = deque()  # finished session ids, oldest first
+
+        self._httpd = None
+        self._threads: List[threading.Thread] = []
+        self._stop_event = threading.Event()
+
+    @property
+    def server_address(self) -> Tuple[str, int]:
+        """Address the server is bound to (useful when configured with port 0)"""
+        if self._httpd:
+            return self._httpd.server_address[:2]
+        return (self.host, self.port)
+
+    def start(self):
+        """Start the HTTP server and broadcaster threads"""
+        self._stop_event.clear()
+        self._httpd = ThreadingHTTPServer((self.host, self.port), self._make_handler())
+        self._httpd.daemon_threads = True
+
+        self._threads = [
+            threading.Thread(target=self._httpd.serve_forever, name="progress-http", daemon=True),
+            threading.Thread(target=self._broadcast_loop, name="progress-broadcast", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+        host, port = self.server_address
+        self.logger.info(f"Progress event server listening on http://{host}:{port}/events")
+
+    def stop(self):
+        """Stop the server and disconnect clients"""
+        self._stop_event.set()
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+        with self._lock:
+            for client in self._clients:
+                self._offer(client, None)
+            self._clients = []
+
+        for thread in self._threads:
+            thread.join(timeout=2)
+        self._threads = []
+
+    # Publishing API (called from the transfer path)
+
+    def session_started(self, session_id: str, total_files: int, total_bytes: int):
+        """Record the start of a transfer session"""
+        self._publish(session_id, None, {
+            'state': SessionStatus.STARTED,
+            'total_files': total_files,
+            'total_bytes': total_bytes,
+        })
+
+    def session_finished(self, session_id: str, success_count: int, failed: bool = False,
+                         degraded: bool = False):
+        """Record the end of a transfer session; degraded means the primary share got nothing"""
+        if failed:
+            state = SessionStatus.FAILED
+        elif degraded:
+            state = SessionStatus.DEGRADED
+        else:
+            state = SessionStatus.COMPLETED
+        self._publish(session_id, None, {
+            'state': state,
+            'success_count': success_count,
+        })
+        self._retire(session_id)
+
+    def file_state(self, session_id: str, filename: str, state: str, **fields):
+        """Record a per-file state transition"""
+        self._publish(session_id, filename, dict(fields, state=state))
+
+    def file_progress(self, session_id: str, filename: str, bytes_done: int, total_bytes: int):
+        """Record byte progress for a file"""
+        self._publish(session_id, filename, {
+            'bytes_done': bytes_done,
+            'total_bytes': total_bytes,
+        })
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Return the latest known state of every session and file"""
+        with self._lock:
+            return [dict(entry) for entry in self._snapshot.values()]
+
+    def _publish(self, session_id: str, filename: Optional[str], fields: Dict[str, Any]):
+        """Merge fields into the pending frame for a session/file"""
+        key = (session_id, filename)
+        with self._lock:
+            entry = self._snapshot.get(key)
+            if entry is None:
+                entry = {'session': session_id, 'file': filename}
+                self._snapshot[key] = entry
+            entry.update(fields)
+            entry['timestamp'] = time.time()
+            self._pending[key] = entry
+
+    def _retire(self, session_id: str):
+        """Forget finished sessions beyond the newest retain_sessions, so the snapshot stays bounded"""
+        with self._lock:
+            if session_id in self._finished:
+                return
+            self._finished.append(session_id)
+            while len(self._finished) > self.retain_sessions:
+                expired = self._finished.popleft()
+                # Pending entries are still flushed; only the snapshot forgets them
+                for key in [key for key in self._snapshot if key[0] == expired]:
+                    del self._snapshot[key]
+
+    # Broadcasting
+
+    def _broadcast_loop(self):
+        """Flush coalesced updates to all clients at the configured frame rate"""
+        while not self._stop_event.wait(self.frame_interval):
+            self._flush()
+        self._flush()
+
+    def _flush(self):
+        """Send pending updates as a single frame"""
+        with self._lock:
+            if not self._pending:
+                return
+            events = [dict(entry) for entry in self._pending.values()]
+            self._pending = {}
+            self._sequence += 1
+            frame = ('progress', {'seq': self._sequence, 'events': events})
+            clients = list(self._clients)
+
+        for client in clients:
+            if not self._offer(client, frame):
+                # Client fell behind; replace its backlog with a full snapshot
+                self._drain(client)
+                self._offer(client, self._snapshot_frame())
+
+    def _snapshot_frame(self):
+        """Build a snapshot frame for new or lagging clients"""
+        with self._lock:
+            return ('snapshot', {
+                'seq': self._sequence,
+                'events': [dict(entry) for entry in self._snapshot.values()],
+            })
+
+    def _register_client(self) -> queue.Queue:
+        """Register a client queue primed with the current snapshot"""
+        client = queue.Queue(maxsize=self.CLIENT_QUEUE_SIZE)
+        client.put_nowait(self._snapshot_frame())
+        with self._lock:
+            self._clients.append(client)
+        return client
+
+    def _unregister_client(self, client: queue.Queue):
+        """Remove a client queue"""
+        with self._lock:
+            if client in self._clients:
+                self._clients.remove(client)
+
+    @staticmethod
+    def _offer(client: queue.Queue, frame) -> bool:
+        """Enqueue a frame without blocking"""
+        try:
+            client.put_nowait(frame)
+            return True
+        except queue.Full:
+            return False
+
+    @staticmethod
+    def _drain(client: queue.Queue):
+        """Discard all queued frames for a client"""
+        try:
+            while True:
+                client.get_nowait()
+        except queue.Empty:
+            pass
+
+    def _make_handler(self):
+        """Build the request handler bound to this server"""
+        server = self
+
+        class ProgressRequestHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?', 1)[0]
+                if path == '/events':
+                    self._stream_events()
+                elif path == '/status':
+                    self._send_json(server.snapshot())
+                else:
+                    self.send_error(404)
+
+            def _send_json(self, payload):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _stream_events(self):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Cache-Control', 'no-cache')
+                self.send_header('Connection', 'keep-alive')
+                self.end_headers()
+
+                client = server._register_client()
+                try:
+                    while not server._stop_event.is_set():
+                        try:
+                            frame = client.get(timeout=server.HEARTBEAT_INTERVAL)
+                        except queue.Empty:
+                            self.wfile.write(b': keepalive\n\n')
+                            self.wfile.flush()
+                            continue
+
+                        if frame is None:
+                            break
+
+                        event, data = frame
+                        message = f"id: {data['seq']}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+                        self.wfile.write(message.encode('utf-8'))
+                        self.wfile.flush()
+
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    server._unregister_client(client)
+
+            def log_message(self, format, *args):
+                server.logger.debug(f"Progress client {self.address_string()}: {format % args}")
+
+        return ProgressRequestHandler
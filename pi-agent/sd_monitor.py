@@ -5,10 +5,15 @@ SD Card monitoring and file detection
 import os
 import time
 from pathlib import Path
-from typing import List, Set
+from typing import List, Set, Dict, Tuple
 import psutil
 import logging
 
+# Extensions that make up a RAW+JPEG pair when they share a stem in one folder
+RAW_EXTENSIONS = ['.cr2', '.nef', '.arw', '.raf', '.orf', '.dng', '.rw2']
+JPEG_EXTENSIONS = ['.jpg', '.jpeg']
+PAIR_POLICIES = ['both', 'jpeg_first', 'raw_only']
+
 
 class SDCardMonitor:
     def __init__(self, config):
@@ -133,6 +138,51 @@ class SDCardMonitor:
             
         return photo_files
         
+    def pair_photos(self, photo_files: List[str]) -> Dict[str, str]:
+        """Map each half of a RAW+JPEG pair (same folder, same stem) to the other half"""
+        raws = {}
+        jpegs = {}
+        
+        for file_path in photo_files:
+            stem, file_ext = os.path.splitext(file_path)
+            key = (os.path.dirname(file_path), os.path.basename(stem).lower())
+            if file_ext.lower() in RAW_EXTENSIONS:
+                raws[key] = file_path
+            elif file_ext.lower() in JPEG_EXTENSIONS:
+                jpegs[key] = file_path
+                
+        pairs = {}
+        for key, raw_path in raws.items():
+            jpeg_path = jpegs.get(key)
+            if jpeg_path:
+                pairs[raw_path] = jpeg_path
+                pairs[jpeg_path] = raw_path
+                
+        return pairs
+        
+    def plan_transfer(self, photo_files: List[str]) -> Tuple[List[str], List[str], Dict[str, str]]:
+        """Apply the RAW+JPEG policy: files to transfer now, RAWs deferred behind them, and the pairs"""
+        policy = self.config.get_raw_jpeg_policy()
+        if policy not in PAIR_POLICIES:
+            self.logger.warning(f"Unknown RAW+JPEG policy '{policy}', transferring both")
+            policy = 'both'
+            
+        pairs = self.pair_photos(photo_files)
+        if not pairs or policy == 'both':
+            return photo_files, [], pairs
+            
+        is_jpeg = {path: os.path.splitext(path)[1].lower() in JPEG_EXTENSIONS for path in pairs}
+        
+        if policy == 'raw_only':
+            files = [path for path in photo_files if not is_jpeg.get(path, False)]
+            self.logger.info(f"Skipping {len(photo_files) - len(files)} JPEGs paired with a RAW")
+            return files, [], pairs
+            
+        # jpeg_first: paired RAWs wait until every JPEG (and unpaired file) has landed
+        files = [path for path in photo_files if is_jpeg.get(path, True)]
+        deferred = [path for path in photo_files if not is_jpeg.get(path, True)]
+        return files, deferred, pairs
+        
     def _scan_directory(self, directory: str, supported_extensions: List[str], min_file_size: int) -> List[str]:
         """Scan a specific directory for photo files"""
         files = []
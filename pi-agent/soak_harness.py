@@ -0,0 +1,539 @@
+#!/usr/bin/env python3
+"""
+Soak harness for Pickly Pi Agent
+
+Runs the full agent (card scan, transfer, verify, manifest) against a local
+stand-in share with scripted network and storage faults, then checks every
+file on the share against the synthetic card and reports throughput,
+recovery time and correctness.
+"""
+
+import os
+import sys
+import json
+import time
+import errno
+import random
+import shutil
+import hashlib
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import Counter
+from typing import Dict, Any, List, Optional, Tuple
+
+from destinations import LocalDestination
+from pack import INDEX_SUFFIX
+from main import PicklyPiAgent
+
+
+MB = 1024 * 1024
+FILES_PER_FOLDER = 500
+
+
+class FaultInjector:
+    """Scripted faults shared by all stand-in destinations of a run"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, bandwidth: Optional[float] = None,
+                 drop_rate: float = 0.0, corrupt_rate: float = 0.0, disk_quota: Optional[int] = None,
+                 outages: Optional[List[Tuple[float, float]]] = None, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.drop_rate = drop_rate
+        self.corrupt_rate = corrupt_rate
+        self.disk_quota = disk_quota
+        self.outages = outages or []
+
+        self.counts = Counter()
+        self.recoveries = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._next_free = 0.0
+        self._disk_usage = {}
+        self._unrecovered = {}
+
+    def start(self):
+        """Start the outage clock"""
+        self._started = time.monotonic()
+
+    def in_outage(self) -> bool:
+        """Whether the share is currently unreachable"""
+        elapsed = time.monotonic() - self._started
+        return any(start <= elapsed < start + duration for start, duration in self.outages)
+
+    def check_connect(self, name: str):
+        """Refuse connections while the share is down"""
+        if self.in_outage():
+            self.counts['refused_connect'] += 1
+            raise ConnectionRefusedError(f"[soak] {name} unreachable (scripted outage)")
+
+    def before_operation(self, name: str, operation: str, nbytes: int = 0):
+        """Apply latency and bandwidth, then fail the operation if the connection drops"""
+        delay = self.latency
+        if self.jitter:
+            with self._lock:
+                delay += self._random.uniform(0, self.jitter)
+
+        if self.bandwidth and nbytes:
+            # Token bucket shared by every destination, like one uplink
+            with self._lock:
+                now = time.monotonic()
+                start = max(now, self._next_free)
+                self._next_free = start + nbytes / self.bandwidth
+                delay += self._next_free - now
+
+        if delay > 0:
+            time.sleep(delay)
+
+        if self.in_outage():
+            self._record_fault(name, 'outage_drop')
+            raise ConnectionResetError(f"[soak] {name}: connection lost during {operation} (scripted outage)")
+
+        with self._lock:
+            dropped = self.drop_rate and self._random.random() < self.drop_rate
+        if dropped:
+            self._record_fault(name, 'dropped_connection')
+            raise ConnectionResetError(f"[soak] {name}: connection dropped during {operation}")
+
+    def reserve(self, name: str, path: str, end_offset: int):
+        """Account for written bytes; raise ENOSPC past the quota"""
+        with self._lock:
+            previous = self._disk_usage.get(path, 0)
+            grown = max(end_offset - previous, 0)
+            if self.disk_quota is not None and sum(self._disk_usage.values()) + grown > self.disk_quota:
+                self.counts['disk_full'] += 1
+                raise OSError(errno.ENOSPC, f"[soak] {name}: no space left on device", path)
+            self._disk_usage[path] = previous + grown
+
+    def truncate(self, path: str):
+        """A file opened for overwrite gives back its space"""
+        with self._lock:
+            self._disk_usage.pop(path, None)
+
+    def maybe_corrupt(self, data: bytes) -> bytes:
+        """Flip one byte of a chunk now and then"""
+        with self._lock:
+            corrupt = data and self.corrupt_rate and self._random.random() < self.corrupt_rate
+            position = self._random.randrange(len(data)) if corrupt else 0
+        if not corrupt:
+            return data
+        self.counts['corrupted_chunk'] += 1
+        damaged = bytearray(data)
+        damaged[position] ^= 0xFF
+        return bytes(damaged)
+
+    def record_success(self, name: str):
+        """Close the recovery window of the oldest unrecovered fault"""
+        with self._lock:
+            faulted_at = self._unrecovered.pop(name, None)
+        if faulted_at is not None:
+            self.recoveries.append(time.monotonic() - faulted_at)
+
+    def _record_fault(self, name: str, kind: str):
+        """Count a fault and open its recovery window"""
+        with self._lock:
+            self.counts[kind] += 1
+            self._unrecovered.setdefault(name, time.monotonic())
+
+
+class FaultyDestination(LocalDestination):
+    """Stand-in share: a local directory behind a connection that can fail like SMB"""
+
+    def __init__(self, name: str, base_path: str, faults: FaultInjector):
+        super().__init__(name, base_path)
+        self.faults = faults
+        self.connected = False
+
+    def connect(self):
+        """Establish the (simulated) connection"""
+        self.faults.check_connect(self.name)
+        super().connect()
+        self.connected = True
+
+    def disconnect(self):
+        """Drop the (simulated) connection"""
+        self.connected = False
+
+    def create_directory(self, path: str):
+        """Create directory on the stand-in share"""
+        self._operation('create_directory')
+        super().create_directory(path)
+
+    def get_file_size(self, path: str) -> Optional[int]:
+        """Return the size of a file, or None on any error (as the SMB destination does)"""
+        try:
+            self._operation('query_info')
+        except ConnectionError:
+            return None
+        return super().get_file_size(path)
+
+    def open_for_write(self, path: str):
+        """Create (or overwrite a partial) file for writing"""
+        self._operation('create')
+        self.faults.truncate(path)
+        return super().open_for_write(path)
+
+    def write(self, handle, data: bytes, offset: int):
+        """Write data at offset through the fault script"""
+        self._operation('write', len(data))
+        self.faults.reserve(self.name, handle.name, offset + len(data))
+        super().write(handle, self.faults.maybe_corrupt(data), offset)
+        self.faults.record_success(self.name)
+
+    def close(self, handle):
+        """Close the handle; the local file is released even if the close fails"""
+        try:
+            self._operation('close')
+        except ConnectionError:
+            handle.close()
+            raise
+        super().close(handle)
+
+    def rename(self, path: str, new_path: str):
+        """Rename a file through the fault script"""
+        self._operation('rename')
+        super().rename(path, new_path)
+
+    def read_chunks(self, path: str, chunk_size: int):
+        """Read a file back through the fault script"""
+        self._operation('open')
+        for chunk in super().read_chunks(path, chunk_size):
+            self._operation('read', len(chunk))
+            yield chunk
+
+    def _operation(self, operation: str, nbytes: int = 0):
+        """Run one round trip; a dropped connection stays down until reconnect"""
+        if not self.connected:
+            raise ConnectionError(f"[soak] {self.name}: not connected")
+        try:
+            self.faults.before_operation(self.name, operation, nbytes)
+        except ConnectionError:
+            self.connected = False
+            raise
+
+
+class SyntheticCard:
+    """Camera-like DCIM tree on a plain directory, tmpfs or loop-mounted image"""
+
+    def __init__(self, mount_point: str, backend: str = 'dir', filesystem: str = 'vfat',
+                 size_bytes: int = 0):
+        self.mount_point = mount_point
+        self.backend = backend
+        self.filesystem = filesystem
+        self.size_bytes = size_bytes
+        self.image_path = None
+        self.mounted = False
+
+    def mount(self):
+        """Prepare the card storage"""
+        os.makedirs(self.mount_point, exist_ok=True)
+
+        if self.backend == 'tmpfs':
+            self._run(['mount', '-t', 'tmpfs', '-o', f"size={self.size_bytes}", 'tmpfs', self.mount_point])
+            self.mounted = True
+        elif self.backend == 'loop':
+            self.image_path = f"{self.mount_point}.img"
+            with open(self.image_path, 'wb') as f:
+                f.truncate(self.size_bytes)
+            mkfs = ['mkfs.vfat', '-F', '32'] if self.filesystem == 'vfat' else [f"mkfs.{self.filesystem}", '-q', '-F']
+            self._run(mkfs + [self.image_path])
+            self._run(['mount', '-o', 'loop', self.image_path, self.mount_point])
+            self.mounted = True
+        elif self.backend != 'dir':
+            raise ValueError(f"Unknown card backend: {self.backend}")
+
+    def populate(self, count: int, file_size: int, small_ratio: float, small_size: int,
+                 seed: int) -> Dict[str, Tuple[int, str]]:
+        """Write unique photo-like files; returns name -> (size, sha256)"""
+        rng = random.Random(seed)
+        expected = {}
+
+        for index in range(count):
+            folder = os.path.join(self.mount_point, 'DCIM', f"{100 + index // FILES_PER_FOLDER}PICKL")
+            os.makedirs(folder, exist_ok=True)
+
+            small = rng.random() < small_ratio
+            name = f"IMG_{index:05d}.{'JPG' if small else 'CR2'}"
+            size = small_size if small else file_size
+            # Unique header so no two files share content
+            data = f"{name}:{seed}:".encode() + rng.randbytes(size)
+            data = data[:size]
+
+            with open(os.path.join(folder, name), 'wb') as f:
+                f.write(data)
+            expected[name] = (size, hashlib.sha256(data).hexdigest())
+
+        os.sync()
+        return expected
+
+    def unmount(self):
+        """Release the card storage"""
+        if self.mounted:
+            self._run(['umount', self.mount_point])
+            self.mounted = False
+        if self.image_path and os.path.exists(self.image_path):
+            os.remove(self.image_path)
+
+    @staticmethod
+    def _run(command: List[str]):
+        """Run a mount helper, surfacing its error output"""
+        try:
+            result = subprocess.run(command, capture_output=True, text=True)
+        except FileNotFoundError:
+            raise RuntimeError(f"{command[0]} not found; install it or use another card backend")
+        if result.returncode != 0:
+            raise RuntimeError(f"{' '.join(command)} failed: {result.stderr.strip() or result.returncode}")
+
+
+def build_config(args, workdir: str) -> str:
+    """Agent config for the run, derived from config.example.json"""
+    example = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.example.json')
+    with open(example) as f:
+        config = json.load(f)
+
+    config['paths']['sd_mount_base'] = os.path.join(workdir, 'media')
+    config['paths']['temp_dir'] = os.path.join(workdir, 'tmp')
+    config['transfer']['max_retries'] = args.max_retries
+    config['transfer']['retry_delay'] = args.retry_delay
+    config['transfer']['verify_checksums'] = not args.no_verify
+    config['destinations'] = []
+    config['transfer']['pack']['enabled'] = args.pack
+    config['transfer']['pack']['max_file_size'] = int(args.small_size_mb * MB)
+    config['monitoring']['min_file_size'] = 1
+    config['progress']['enabled'] = False
+    config['profiling']['output_dir'] = os.path.join(workdir, 'profiles')
+    config['logging']['level'] = args.log_level
+    config['logging']['file'] = os.path.join(workdir, 'agent.log')
+
+    path = os.path.join(workdir, 'config.json')
+    with open(path, 'w') as f:
+        json.dump(config, f, indent=2)
+    return path
+
+
+def check_destination(share_dir: str, expected: Dict[str, Tuple[int, str]], name: str) -> Dict[str, Any]:
+    """Compare every file on one stand-in share with the card"""
+    sessions = sorted(os.listdir(share_dir)) if os.path.isdir(share_dir) else []
+    result = Counter()
+    silent = []
+
+    if not sessions:
+        return {'session': None, 'verified': 0, 'missing': len(expected), 'silent_corruption': []}
+
+    session_dir = os.path.join(share_dir, sessions[-1])
+    manifest_files = {}
+    try:
+        with open(os.path.join(session_dir, 'manifest.json')) as f:
+            manifest_files = json.load(f).get('files', {})
+    except (OSError, ValueError):
+        result['manifest_missing'] = 1
+
+    for filename, (size, digest) in expected.items():
+        reported_ok = manifest_files.get(filename, {}).get('destinations', {}).get(name, False)
+        path = os.path.join(session_dir, filename)
+        segment = manifest_files.get(filename, {}).get('pack')
+
+        intact = False
+        if segment:
+            member = packed_member(session_dir, segment, filename)
+            exists = member is not None
+            intact = member == (size, digest)
+        else:
+            exists = os.path.exists(path)
+            if exists and os.path.getsize(path) == size:
+                with open(path, 'rb') as f:
+                    intact = sha256_file(f) == digest
+
+        if intact:
+            result['verified'] += 1
+            result['verified_bytes'] += size
+        elif not exists:
+            result['missing'] += 1
+        else:
+            result['damaged'] += 1
+
+        if reported_ok:
+            result['reported_ok'] += 1
+            if not intact:
+                silent.append(filename)
+        elif intact:
+            result['unreported_ok'] += 1
+
+    return {'session': sessions[-1], **result, 'silent_corruption': silent}
+
+
+def packed_member(session_dir: str, segment: str, filename: str) -> Optional[Tuple[int, str]]:
+    """Size and SHA-256 of a file inside a committed pack segment, or None if it isn't there"""
+    try:
+        with open(os.path.join(session_dir, segment + INDEX_SUFFIX)) as f:
+            entry = next(e for e in json.load(f)['files'] if e['name'] == filename)
+        with open(os.path.join(session_dir, segment), 'rb') as f:
+            f.seek(entry['offset'])
+            data = f.read(entry['size'])
+    except (OSError, ValueError, StopIteration):
+        return None
+    return len(data), hashlib.sha256(data).hexdigest()
+
+
+def sha256_file(f) -> str:
+    """SHA-256 of an open file"""
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: f.read(MB), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def run(args) -> Dict[str, Any]:
+    """Build the card and share, run the agent once and collect the report"""
+    workdir = args.workdir or tempfile.mkdtemp(prefix='pickly-soak-')
+    card = SyntheticCard(
+        os.path.join(workdir, 'media', 'SOAKCARD'), args.card_backend, args.card_fs,
+        int(args.files * max(args.file_size_mb, args.small_size_mb) * MB * 1.2) + 64 * MB
+    )
+    faults = FaultInjector(
+        latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000,
+        bandwidth=args.bandwidth_mbps * MB if args.bandwidth_mbps else None,
+        drop_rate=args.drop_rate, corrupt_rate=args.corrupt_rate,
+        disk_quota=int(args.disk_quota_mb * MB) if args.disk_quota_mb else None,
+        outages=args.outage, seed=args.seed
+    )
+
+    try:
+        card.mount()
+        print(f"Writing {args.files} synthetic files to {card.mount_point} ({args.card_backend})")
+        expected = card.populate(
+            args.files, int(args.file_size_mb * MB), args.small_ratio, int(args.small_size_mb * MB), args.seed
+        )
+        total_bytes = sum(size for size, _ in expected.values())
+
+        agent = PicklyPiAgent(build_config(args, workdir))
+        share_dirs = {}
+        destinations = []
+        for index in range(args.destinations):
+            name = 'primary' if index == 0 else f"backup{index}"
+            share_dirs[name] = os.path.join(workdir, 'share', name, 'incoming')
+            os.makedirs(share_dirs[name], exist_ok=True)
+            destinations.append(FaultyDestination(name, share_dirs[name], faults))
+        agent.transfer_manager.destinations = destinations
+
+        # Mounted cards go through detection like a real insert
+        if card.mounted and card.mount_point not in agent.sd_monitor.scan_for_cards():
+            print(f"Warning: {card.mount_point} was not detected as a photo card")
+
+        faults.start()
+        started = time.monotonic()
+        agent._process_sd_card(card.mount_point)
+        elapsed = time.monotonic() - started
+        agent.stop()
+
+        checks = {name: check_destination(path, expected, name) for name, path in share_dirs.items()}
+        # Goodput counts only bytes intact on every destination
+        verified_bytes = min(check.get('verified_bytes', 0) for check in checks.values())
+
+        return {
+            'files': args.files,
+            'bytes': total_bytes,
+            'elapsed_s': round(elapsed, 2),
+            'throughput_mb_s': round(total_bytes / elapsed / MB, 2) if elapsed else 0.0,
+            'goodput_mb_s': round(verified_bytes / elapsed / MB, 2) if elapsed else 0.0,
+            'faults': dict(faults.counts),
+            'recovery_s': {
+                'count': len(faults.recoveries),
+                'mean': round(sum(faults.recoveries) / len(faults.recoveries), 3) if faults.recoveries else 0.0,
+                'p50': round(percentile(faults.recoveries, 0.5), 3),
+                'p95': round(percentile(faults.recoveries, 0.95), 3),
+                'max': round(max(faults.recoveries, default=0.0), 3),
+            },
+            'destinations': checks,
+            'stage_timings': agent.transfer_manager.timings.snapshot(),
+            'workdir': workdir,
+        }
+    finally:
+        card.unmount()
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def print_report(report: Dict[str, Any]):
+    """Human readable summary"""
+    print("\nSoak run")
+    print(f"  Files:        {report['files']} ({report['bytes'] / MB:.1f} MB)")
+    print(f"  Elapsed:      {report['elapsed_s']:.1f}s")
+    print(f"  Throughput:   {report['throughput_mb_s']:.1f} MB/s offered, {report['goodput_mb_s']:.1f} MB/s landed")
+
+    faults = ', '.join(f"{kind}={count}" for kind, count in sorted(report['faults'].items())) or 'none'
+    print(f"  Faults:       {faults}")
+    recovery = report['recovery_s']
+    print(f"  Recovery:     {recovery['count']} windows, mean {recovery['mean']:.2f}s, "
+          f"p50 {recovery['p50']:.2f}s, p95 {recovery['p95']:.2f}s, max {recovery['max']:.2f}s")
+
+    for name, check in report['destinations'].items():
+        print(f"  {name}: session {check['session']}")
+        print(f"    verified {check.get('verified', 0)}, missing {check.get('missing', 0)}, "
+              f"damaged {check.get('damaged', 0)}, reported ok {check.get('reported_ok', 0)}"
+              f"{', manifest missing' if check.get('manifest_missing') else ''}")
+        if check['silent_corruption']:
+            print(f"    SILENT CORRUPTION in {len(check['silent_corruption'])} files reported as transferred: "
+                  f"{', '.join(check['silent_corruption'][:10])}")
+
+
+def parse_outage(value: str) -> Tuple[float, float]:
+    """Parse START:DURATION (seconds after the transfer starts)"""
+    start, duration = value.split(':')
+    return float(start), float(duration)
+
+
+def main():
+    """Soak harness entry point"""
+    parser = argparse.ArgumentParser(description="Run the agent against a fault-injecting stand-in share")
+    parser.add_argument('--files', type=int, default=2000, help="Number of files on the synthetic card")
+    parser.add_argument('--file-size-mb', type=float, default=2.0, help="Size of RAW-like files")
+    parser.add_argument('--small-ratio', type=float, default=0.3, help="Fraction of small JPEG-like files")
+    parser.add_argument('--small-size-mb', type=float, default=0.25, help="Size of small files")
+    parser.add_argument('--card-backend', choices=['dir', 'tmpfs', 'loop'], default='dir',
+                        help="Card storage (tmpfs and loop need root)")
+    parser.add_argument('--card-fs', default='vfat', help="Filesystem of the loop image")
+    parser.add_argument('--destinations', type=int, default=1, help="Number of stand-in destinations")
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="Added latency per round trip")
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help="Random extra latency per round trip")
+    parser.add_argument('--bandwidth-mbps', type=float, default=0.0, help="Shared uplink cap in MB/s (0 = unlimited)")
+    parser.add_argument('--drop-rate', type=float, default=0.0, help="Probability a round trip drops the connection")
+    parser.add_argument('--corrupt-rate', type=float, default=0.0, help="Probability a written chunk is corrupted")
+    parser.add_argument('--disk-quota-mb', type=float, default=0.0, help="Share capacity (0 = unlimited)")
+    parser.add_argument('--outage', type=parse_outage, action='append', default=[],
+                        help="Share unreachable for START:DURATION seconds (repeatable)")
+    parser.add_argument('--max-retries', type=int, default=3)
+    parser.add_argument('--retry-delay', type=float, default=0.2)
+    parser.add_argument('--no-verify', action='store_true', help="Disable checksum verification")
+    parser.add_argument('--pack', action='store_true', help="Pack small files into segments")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--log-level', default='WARNING')
+    parser.add_argument('--workdir', help="Keep the run in this directory instead of a temp dir")
+    parser.add_argument('--keep', action='store_true', help="Keep the temp directory after the run")
+    parser.add_argument('--json', help="Also write the report as JSON to this path")
+    args = parser.parse_args()
+
+    report = run(args)
+    print_report(report)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    silent = any(check['silent_corruption'] for check in report['destinations'].values())
+    sys.exit(1 if silent else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Tests for the progress event server against a local SSE client
+"""
+
+import json
+import unittest
+import http.client
+
+from progress_server import ProgressEventServer, SessionStatus, TransferStatus
+
+
+class _Config:
+    """Just the progress section of the agent config"""
+
+    def __init__(self, **progress):
+        self.progress = dict({'host': '127.0.0.1', 'port': 0}, **progress)
+
+    def get_progress_config(self):
+        return self.progress
+
+
+class ProgressEventServerTest(unittest.TestCase):
+    """Starts the server on an ephemeral port and reads /events like a browser would"""
+
+    def start_server(self, **progress):
+        server = ProgressEventServer(_Config(**progress))
+        server.start()
+        self.addCleanup(server.stop)
+        return server
+
+    def connect(self, server):
+        """Open /events and return the response stream"""
+        host, port = server.server_address
+        connection = http.client.HTTPConnection(host, port, timeout=5)
+        self.addCleanup(connection.close)
+        connection.request('GET', '/events')
+        response = connection.getresponse()
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.getheader('Content-Type'), 'text/event-stream')
+        return response
+
+    def read_event(self, response):
+        """Read one SSE message, skipping keepalive comments"""
+        fields = {}
+        while True:
+            line = response.fp.readline().decode('utf-8').rstrip('\n')
+            if not line:
+                if fields:
+                    return fields['event'], json.loads(fields['data'])
+                continue
+            if line.startswith(':'):
+                continue
+            name, _, value = line.partition(': ')
+            fields[name] = value
+
+    def test_first_frame_is_snapshot(self):
+        server = self.start_server()
+        server.session_started('s1', 2, 2048)
+        server.file_state('s1', 'IMG_0001.CR3', TransferStatus.WAITING, bytes_done=0, total_bytes=1024)
+
+        event, data = self.read_event(self.connect(server))
+
+        self.assertEqual(event, 'snapshot')
+        entries = {(entry['session'], entry['file']): entry for entry in data['events']}
+        self.assertEqual(entries[('s1', None)]['state'], SessionStatus.STARTED)
+        self.assertEqual(entries[('s1', 'IMG_0001.CR3')]['state'], TransferStatus.WAITING)
+
+    def test_rapid_updates_are_coalesced(self):
+        server = self.start_server(frame_rate=2)
+        response = self.connect(server)
+        self.assertEqual(self.read_event(response)[0], 'snapshot')
+
+        for done in range(1, 101):
+            server.file_progress('s1', 'IMG_0001.CR3', done * 1024, 100 * 1024)
+
+        # 100 updates within one frame interval arrive as one entry (two if a flush fell in between)
+        frames = []
+        while not frames or frames[-1][-1]['bytes_done'] < 100 * 1024:
+            event, data = self.read_event(response)
+            self.assertEqual(event, 'progress')
+            frames.append([entry for entry in data['events'] if entry['file'] == 'IMG_0001.CR3'])
+
+        self.assertLessEqual(len(frames), 2)
+        self.assertTrue(all(len(entries) == 1 for entries in frames))
+        self.assertEqual(frames[-1][0]['total_bytes'], 100 * 1024)
+
+    def test_snapshot_keeps_recent_sessions(self):
+        server = self.start_server(retain_sessions=2)
+        for number in range(1, 5):
+            session = f"s{number}"
+            server.session_started(session, 1, 1024)
+            server.file_state(session, 'IMG_0001.CR3', TransferStatus.SUCCESS)
+            server.session_finished(session, 1)
+        server.session_started('s5', 1, 1024)
+
+        event, data = self.read_event(self.connect(server))
+
+        self.assertEqual(event, 'snapshot')
+        self.assertEqual({entry['session'] for entry in data['events']}, {'s3', 's4', 's5'})
+        self.assertEqual(len(data['events']), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
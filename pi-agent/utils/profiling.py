@@ -0,0 +1,270 @@
+"""
+Runtime introspection for Pickly Pi Agent (stage timings, stack dumps, profiling)
+"""
+
+import os
+import sys
+import time
+import signal
+import pstats
+import cProfile
+import datetime
+import threading
+import traceback
+import logging
+from collections import Counter, defaultdict, deque
+from contextlib import contextmanager
+from typing import Dict, Any, Iterable, Iterator, Optional
+
+
+class StageTimings:
+    """Cumulative wall time, call count and bytes per transfer stage"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = defaultdict(lambda: [0.0, 0, 0])  # seconds, calls, bytes
+
+    def add(self, stage: str, seconds: float, nbytes: int = 0):
+        """Record one timed call"""
+        with self._lock:
+            entry = self._stages[stage]
+            entry[0] += seconds
+            entry[1] += 1
+            entry[2] += nbytes
+
+    @contextmanager
+    def stage(self, name: str, nbytes: int = 0):
+        """Time a block of code"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started, nbytes)
+
+    def timed(self, name: str, iterable: Iterable[bytes]) -> Iterator[bytes]:
+        """Time each step of an iterator of byte chunks"""
+        iterator = iter(iterable)
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.add(name, time.perf_counter() - started, len(item))
+            yield item
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Copy of the current totals"""
+        with self._lock:
+            return {
+                stage: {'seconds': seconds, 'calls': calls, 'bytes': nbytes}
+                for stage, (seconds, calls, nbytes) in self._stages.items()
+            }
+
+    def format(self) -> str:
+        """Human readable table of stage totals"""
+        lines = []
+        for stage, entry in sorted(self.snapshot().items(), key=lambda item: -item[1]['seconds']):
+            line = f"  {stage:<24} {entry['seconds']:10.2f}s {entry['calls']:10d} calls"
+            if entry['bytes'] and entry['seconds'] > 0:
+                rate = entry['bytes'] / entry['seconds'] / (1024 * 1024)
+                line += f" {entry['bytes'] / (1024 * 1024):10.1f} MB {rate:8.1f} MB/s"
+            lines.append(line)
+        return "\n".join(lines) if lines else "  (no stages recorded)"
+
+
+class SamplingProfiler:
+    """Low-overhead wall-clock sampler of all threads, output as collapsed stacks"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start sampling in a background thread"""
+        self.samples = Counter()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def write_collapsed(self, path: str):
+        """Write samples in collapsed-stack format (input for flamegraph.pl / speedscope)"""
+        with open(path, 'w') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def _run(self):
+        """Aggregate one stack per thread every interval"""
+        own_id = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples[";".join(reversed(stack))] += 1
+
+
+class AgentProfiler:
+    """Signal-driven introspection: SIGUSR1 dumps state, SIGUSR2 toggles profiling"""
+
+    def __init__(self, config, timings: StageTimings):
+        self.config = config
+        self.timings = timings
+        self.logger = logging.getLogger(__name__)
+        profiling_config = config.get_profiling_config()
+
+        self.output_dir = profiling_config.get('output_dir', '/var/log/pickly-pi/profiles')
+        self.mode = profiling_config.get('mode', 'sampling')
+        self.sample_interval = profiling_config.get('sample_interval', 0.01)
+        self.cprofile_seconds = profiling_config.get('cprofile_seconds', 30)
+
+        self._sampler: Optional[SamplingProfiler] = None
+        self._cprofile: Optional[cProfile.Profile] = None
+
+        # Handlers only append here; deque.append takes no lock the interrupted thread could hold
+        self._requests = deque()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def install(self):
+        """Register signal handlers and start the control thread (no-op where the signals don't exist)"""
+        if not hasattr(signal, 'SIGUSR1'):
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="profiler-control", daemon=True)
+        self._thread.start()
+        signal.signal(signal.SIGUSR1, self._handle_dump)
+        signal.signal(signal.SIGUSR2, self._handle_toggle)
+        signal.signal(signal.SIGALRM, self._handle_cprofile_timeout)
+        self.logger.info(
+            f"Profiling hooks installed (pid {os.getpid()}): "
+            f"SIGUSR1 dumps threads and timings, SIGUSR2 toggles {self.mode} profiling"
+        )
+
+    def dump_state(self) -> str:
+        """Write thread stacks and stage timings to a file and the log"""
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        lines = [f"Pickly Pi Agent state at {datetime.datetime.now().isoformat()}", "", "Stage timings:",
+                 self.timings.format(), ""]
+        for thread_id, frame in sys._current_frames().items():
+            lines.append(f"Thread {names.get(thread_id, thread_id)} ({thread_id}):")
+            lines.extend(line.rstrip('\n') for line in traceback.format_stack(frame))
+            lines.append("")
+        report = "\n".join(lines)
+
+        path = self._output_path('threads', 'txt')
+        with open(path, 'w') as f:
+            f.write(report)
+
+        self.logger.info(f"Stage timings:\n{self.timings.format()}")
+        self.logger.info(f"Thread dump written to {path}")
+        return path
+
+    def toggle(self):
+        """Start or stop the sampling profiler (cProfile windows are toggled from the signal handler)"""
+        if self._sampler is None:
+            self._sampler = SamplingProfiler(self.sample_interval)
+            self._sampler.start()
+            self.logger.info(f"Sampling profiler started ({self.sample_interval * 1000:.0f} ms interval)")
+        else:
+            self._stop_sampler()
+
+    def shutdown(self):
+        """Stop the control thread and flush any running profiler"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self._process_requests()
+        if self._sampler is not None:
+            self._stop_sampler()
+        if self._cprofile is not None:
+            self._write_cprofile(self._end_cprofile())
+
+    def _run(self):
+        """Carry out requests queued by the signal handlers"""
+        while not self._stop_event.wait(0.2):
+            self._process_requests()
+
+    def _process_requests(self):
+        """Dump state, toggle sampling or write finished cProfile windows"""
+        while self._requests:
+            request = self._requests.popleft()
+            try:
+                if request == 'dump':
+                    self.dump_state()
+                elif request == 'toggle':
+                    self.toggle()
+                elif request == 'cprofile-started':
+                    self.logger.info(f"cProfile window started for {self.cprofile_seconds}s")
+                else:
+                    self._write_cprofile(request)
+            except Exception as e:
+                self.logger.error(f"Profiler request failed: {e}")
+
+    def _end_cprofile(self) -> cProfile.Profile:
+        """Stop the cProfile window; cheap enough for a signal handler"""
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        profile, self._cprofile = self._cprofile, None
+        profile.disable()
+        return profile
+
+    def _write_cprofile(self, profile: cProfile.Profile):
+        """Write pstats output for a finished cProfile window"""
+        path = self._output_path('profile', 'pstats')
+        profile.dump_stats(path)
+        self.logger.info(f"cProfile stats written to {path}")
+        top = sorted(pstats.Stats(path).stats.items(), key=lambda item: -item[1][3])[:10]
+        for (filename, line, function), (_, _, _, cumulative, _) in top:
+            self.logger.info(f"  {cumulative:8.3f}s {function} ({os.path.basename(filename)}:{line})")
+
+    def _stop_sampler(self):
+        """Stop sampling and write collapsed stacks"""
+        sampler, self._sampler = self._sampler, None
+        sampler.stop()
+        path = self._output_path('profile', 'collapsed')
+        sampler.write_collapsed(path)
+        self.logger.info(f"Sampling profiler stopped: {sum(sampler.samples.values())} samples written to {path}")
+
+    def _output_path(self, prefix: str, extension: str) -> str:
+        """Timestamped file in the profile output directory"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        return os.path.join(self.output_dir, f"{prefix}-{timestamp}-{os.getpid()}.{extension}")
+
+    # Signal handlers interrupt the main thread between bytecodes, possibly while it holds
+    # a lock (logging, the timings table); they only queue requests for the control thread.
+    # cProfile only profiles the thread that enables it, so its window starts and ends here.
+
+    def _handle_dump(self, signum, frame):
+        self._requests.append('dump')
+
+    def _handle_toggle(self, signum, frame):
+        if self.mode != 'cprofile':
+            self._requests.append('toggle')
+        elif self._cprofile is None:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+            signal.setitimer(signal.ITIMER_REAL, self.cprofile_seconds)
+            self._requests.append('cprofile-started')
+        else:
+            self._requests.append(self._end_cprofile())
+
+    def _handle_cprofile_timeout(self, signum, frame):
+        if self._cprofile is not None:
+            self._requests.append(self._end_cprofile())
@@ -0,0 +1 @@
+# Processing engine package
\ No newline at end of file
@@ -0,0 +1,239 @@
+"""
+SQLite photo catalog built from header-only EXIF extraction
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+
+from shared.constants import ALL_SUPPORTED_EXTENSIONS
+from processing.exif_reader import read_exif, ExifError
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS photos (
+    path TEXT PRIMARY KEY,
+    session TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    capture_time TEXT,
+    capture_ts REAL,
+    utc_offset TEXT,
+    camera_make TEXT,
+    camera_model TEXT,
+    camera_serial TEXT,
+    lens TEXT,
+    iso INTEGER,
+    exposure_time REAL,
+    f_number REAL,
+    focal_length REAL,
+    exif_error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_photos_session_time ON photos (session, capture_ts);
+CREATE INDEX IF NOT EXISTS idx_photos_camera_time ON photos (camera_serial, capture_ts);
+CREATE INDEX IF NOT EXISTS idx_photos_capture_ts ON photos (capture_ts);
+CREATE TABLE IF NOT EXISTS segments (
+    path TEXT PRIMARY KEY REFERENCES photos (path) ON DELETE CASCADE,
+    session TEXT NOT NULL,
+    scene INTEGER NOT NULL,
+    burst INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_segments_session ON segments (session, scene, burst);
+"""
+
+EXIF_COLUMNS = [
+    'capture_time', 'capture_ts', 'utc_offset', 'camera_make', 'camera_model', 'camera_serial',
+    'lens', 'iso', 'exposure_time', 'f_number', 'focal_length',
+]
+
+INSERT_PHOTO = (
+    f"INSERT OR REPLACE INTO photos (path, session, filename, size, mtime, exif_error, "
+    f"{', '.join(EXIF_COLUMNS)}) VALUES ({', '.join('?' * (6 + len(EXIF_COLUMNS)))})"
+)
+
+
+class PhotoCatalog:
+    """Indexed EXIF catalog; queries never touch the image files"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+
+        # Several processes may index into the same catalog; wait for their write locks
+        self.conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def index_session(self, session_dir: str, workers: int = 8) -> int:
+        """Index all photos in a session directory, skipping unchanged files"""
+        session = os.path.basename(session_dir.rstrip('/'))
+        started = time.time()
+
+        candidates = []
+        for name in os.listdir(session_dir):
+            if os.path.splitext(name)[1].upper() not in ALL_SUPPORTED_EXTENSIONS:
+                continue
+            path = os.path.join(session_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                # Renamed or removed since the listing, e.g. an upload moved into place
+                continue
+            candidates.append((path, name, stat.st_size, stat.st_mtime))
+
+        known = self._known_files(session)
+        pending = [c for c in candidates if known.get(c[0]) != (c[2], c[3])]
+
+        # Header reads are small and I/O bound; threads overlap the latency
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            rows = [row for row in executor.map(lambda c: self._build_row(session, *c), pending) if row]
+
+        with self._lock, self.conn:
+            self.conn.executemany(INSERT_PHOTO, rows)
+
+        self.logger.info(
+            f"Indexed {len(rows)} photos in {session} ({len(candidates) - len(pending)} unchanged) "
+            f"in {time.time() - started:.2f}s"
+        )
+        return len(rows)
+
+    def index_file(self, session: str, path: str) -> Optional[Dict[str, Any]]:
+        """Index (or re-index) a single photo and return its catalog fields; None if it is gone"""
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            self.logger.info(f"Skipping {path}: no longer exists")
+            return None
+        row = self._build_row(session, path, os.path.basename(path), stat.st_size, stat.st_mtime)
+        if row is None:
+            return None
+
+        with self._lock, self.conn:
+            self.conn.execute(INSERT_PHOTO, row)
+
+        return dict(zip(['path', 'session', 'filename', 'size', 'mtime', 'exif_error'] + EXIF_COLUMNS, row))
+
+    def session_photos(self, session: str) -> List[Dict[str, Any]]:
+        """All photos of a session ordered by capture time"""
+        return self.query(session=session)
+
+    def query(self, session: Optional[str] = None, camera_serial: Optional[str] = None,
+              start_ts: Optional[float] = None, end_ts: Optional[float] = None,
+              order_by: str = 'capture_ts') -> List[Dict[str, Any]]:
+        """Filter photos by session, camera and capture time range"""
+        if order_by not in ('capture_ts', 'filename', 'camera_serial, capture_ts'):
+            raise ValueError(f"Unsupported ordering: {order_by}")
+
+        clauses, params = [], []
+        if session is not None:
+            clauses.append("session = ?")
+            params.append(session)
+        if camera_serial is not None:
+            clauses.append("camera_serial = ?")
+            params.append(camera_serial)
+        if start_ts is not None:
+            clauses.append("capture_ts >= ?")
+            params.append(start_ts)
+        if end_ts is not None:
+            clauses.append("capture_ts < ?")
+            params.append(end_ts)
+
+        sql = "SELECT * FROM photos"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += f" ORDER BY {order_by}, filename"
+
+        with self._lock:
+            return [dict(row) for row in self.conn.execute(sql, params)]
+
+    def sessions(self) -> List[Dict[str, Any]]:
+        """Summary per session: photo count and capture time span"""
+        with self._lock:
+            return [dict(row) for row in self.conn.execute(
+                "SELECT session, COUNT(*) AS photos, MIN(capture_ts) AS first_ts, MAX(capture_ts) AS last_ts "
+                "FROM photos GROUP BY session ORDER BY session"
+            )]
+
+    def store_segments(self, session: str, scenes: List[Dict[str, Any]]):
+        """Replace the scene/burst assignment of a session"""
+        rows = []
+        burst_id = 0
+        for scene in scenes:
+            for burst in scene['bursts']:
+                rows.extend((photo['path'], session, scene['id'], burst_id) for photo in burst)
+                burst_id += 1
+
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM segments WHERE session = ?", (session,))
+            self.conn.executemany(
+                "INSERT INTO segments (path, session, scene, burst) VALUES (?, ?, ?, ?)", rows
+            )
+
+    def bursts(self, session: str) -> List[List[Dict[str, Any]]]:
+        """Stored bursts of a session, each ordered by capture time"""
+        with self._lock:
+            rows = [dict(row) for row in self.conn.execute(
+                "SELECT p.*, s.scene, s.burst FROM segments s JOIN photos p ON p.path = s.path "
+                "WHERE s.session = ? ORDER BY s.burst, p.capture_ts, p.filename", (session,)
+            )]
+
+        grouped = []
+        for row in rows:
+            if not grouped or grouped[-1][0]['burst'] != row['burst']:
+                grouped.append([])
+            grouped[-1].append(row)
+        return grouped
+
+    def close(self):
+        """Close the database"""
+        self.conn.close()
+
+    def _known_files(self, session: str) -> Dict[str, tuple]:
+        """Size and mtime of already indexed files in a session"""
+        with self._lock:
+            return {
+                row['path']: (row['size'], row['mtime'])
+                for row in self.conn.execute("SELECT path, size, mtime FROM photos WHERE session = ?", (session,))
+            }
+
+    def _build_row(self, session: str, path: str, name: str, size: int, mtime: float) -> Optional[tuple]:
+        """Extract EXIF for one file into a catalog row; None if the file disappeared"""
+        error = None
+        try:
+            exif = read_exif(path)
+        except FileNotFoundError:
+            self.logger.info(f"Skipping {path}: removed while indexing")
+            return None
+        except (ExifError, OSError, ValueError) as e:
+            self.logger.warning(f"EXIF extraction failed for {path}: {e}")
+            exif, error = {}, str(e)
+
+        return (path, session, name, size, mtime, error) + tuple(exif.get(column) for column in EXIF_COLUMNS)
+
+
+def main():
+    """Index session directories into a catalog database"""
+    if len(sys.argv) < 3:
+        print("Usage: python -m processing.catalog <catalog.db> <session_dir> [<session_dir> ...]")
+        sys.exit(1)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    catalog = PhotoCatalog(sys.argv[1])
+    try:
+        for session_dir in sys.argv[2:]:
+            catalog.index_session(session_dir)
+    finally:
+        catalog.close()
+
+
+if __name__ == "__main__":
+    main()
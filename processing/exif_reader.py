@@ -0,0 +1,234 @@
+"""
+Header-only EXIF extraction for RAW and JPEG files
+"""
+
+import os
+import mmap
+import struct
+import calendar
+import datetime
+from typing import Dict, Any, Optional
+
+
+# IFD0 tags
+TAG_MAKE = 0x010F
+TAG_MODEL = 0x0110
+TAG_DATETIME = 0x0132
+TAG_EXIF_IFD = 0x8769
+
+# Exif IFD tags
+TAG_EXPOSURE_TIME = 0x829A
+TAG_F_NUMBER = 0x829D
+TAG_ISO = 0x8827
+TAG_DATETIME_ORIGINAL = 0x9003
+TAG_OFFSET_TIME_ORIGINAL = 0x9011
+TAG_SUBSEC_TIME_ORIGINAL = 0x9291
+TAG_FOCAL_LENGTH = 0x920A
+TAG_BODY_SERIAL = 0xA431
+TAG_LENS_MAKE = 0xA433
+TAG_LENS_MODEL = 0xA434
+
+WANTED_TAGS = {
+    TAG_MAKE, TAG_MODEL, TAG_DATETIME, TAG_EXIF_IFD,
+    TAG_EXPOSURE_TIME, TAG_F_NUMBER, TAG_ISO, TAG_DATETIME_ORIGINAL, TAG_OFFSET_TIME_ORIGINAL,
+    TAG_SUBSEC_TIME_ORIGINAL, TAG_FOCAL_LENGTH, TAG_BODY_SERIAL, TAG_LENS_MAKE, TAG_LENS_MODEL,
+}
+
+# Field type -> (struct code, size)
+TIFF_TYPES = {
+    1: ('B', 1), 2: ('s', 1), 3: ('H', 2), 4: ('L', 4), 5: ('LL', 8),
+    7: ('B', 1), 9: ('l', 4), 10: ('ll', 8),
+}
+
+# TIFF magic numbers used by RAW formats (42 standard, 0x4F52/0x5352 Olympus, 0x55 Panasonic)
+TIFF_MAGICS = {42, 0x4F52, 0x5352, 0x55}
+
+MAX_IFD_ENTRIES = 1024
+
+
+class ExifError(Exception):
+    """Raised when a file has no readable EXIF header"""
+
+
+def read_exif(path: str) -> Dict[str, Any]:
+    """Extract catalog fields from a file, touching only its header pages"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ExifError(f"Empty file: {path}")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            tiff_offset = _find_tiff_header(data)
+            if tiff_offset is None:
+                raise ExifError(f"No TIFF/EXIF header found: {path}")
+            return _parse_tiff(data, tiff_offset)
+
+
+def _find_tiff_header(data) -> Optional[int]:
+    """Locate the TIFF header for TIFF-based RAWs, RAF and JPEG"""
+    head = data[:16]
+
+    if head[:2] in (b'II', b'MM'):
+        return 0
+
+    if head[:2] == b'\xff\xd8':
+        return _find_jpeg_exif(data, 0)
+
+    if head[:15] == b'FUJIFILMCCD-RAW':
+        # RAF: header points at an embedded JPEG carrying the EXIF block
+        jpeg_offset = _unpack('>L', data, 84)[0]
+        return _find_jpeg_exif(data, jpeg_offset)
+
+    return None
+
+
+def _find_jpeg_exif(data, start: int) -> Optional[int]:
+    """Walk JPEG markers up to start-of-scan looking for the APP1 Exif segment"""
+    offset = start + 2
+    end = len(data)
+
+    while offset + 4 <= end:
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+        if marker == 0xFF:
+            offset += 1
+            continue
+        if marker == 0xDA:  # start of scan, no EXIF before image data
+            return None
+
+        length = _unpack('>H', data, offset + 2)[0]
+        if marker == 0xE1 and data[offset + 4:offset + 10] == b'Exif\x00\x00':
+            return offset + 10
+        offset += 2 + length
+
+    return None
+
+
+def _parse_tiff(data, base: int) -> Dict[str, Any]:
+    """Read IFD0 and the Exif sub-IFD"""
+    order = data[base:base + 2]
+    if order == b'II':
+        endian = '<'
+    elif order == b'MM':
+        endian = '>'
+    else:
+        raise ExifError("Invalid TIFF byte order")
+
+    magic, ifd0_offset = _unpack(endian + 'HL', data, base + 2)
+    if magic not in TIFF_MAGICS:
+        raise ExifError(f"Unknown TIFF magic: {magic:#x}")
+
+    ifd0 = _read_ifd(data, base, ifd0_offset, endian)
+    exif = {}
+    if TAG_EXIF_IFD in ifd0:
+        exif = _read_ifd(data, base, ifd0[TAG_EXIF_IFD], endian)
+
+    date_original = _text(exif.get(TAG_DATETIME_ORIGINAL)) or _text(ifd0.get(TAG_DATETIME))
+    subsec = _text(exif.get(TAG_SUBSEC_TIME_ORIGINAL))
+    capture_time, capture_ts = _parse_datetime(date_original, subsec)
+
+    lens = _text(exif.get(TAG_LENS_MODEL))
+    lens_make = _text(exif.get(TAG_LENS_MAKE))
+    if lens and lens_make and not lens.startswith(lens_make):
+        lens = f"{lens_make} {lens}"
+
+    iso = exif.get(TAG_ISO)
+    if isinstance(iso, tuple):
+        iso = iso[0]
+
+    return {
+        'capture_time': capture_time,
+        'capture_ts': capture_ts,
+        'utc_offset': _text(exif.get(TAG_OFFSET_TIME_ORIGINAL)),
+        'camera_make': _text(ifd0.get(TAG_MAKE)),
+        'camera_model': _text(ifd0.get(TAG_MODEL)),
+        'camera_serial': _text(exif.get(TAG_BODY_SERIAL)),
+        'lens': lens,
+        'iso': iso,
+        'exposure_time': _rational(exif.get(TAG_EXPOSURE_TIME)),
+        'f_number': _rational(exif.get(TAG_F_NUMBER)),
+        'focal_length': _rational(exif.get(TAG_FOCAL_LENGTH)),
+    }
+
+
+def _read_ifd(data, base: int, ifd_offset: int, endian: str) -> Dict[int, Any]:
+    """Read the entries of one IFD, resolving out-of-line values by offset"""
+    start = base + ifd_offset
+    if start + 2 > len(data):
+        raise ExifError("IFD offset out of range")
+
+    count = _unpack(endian + 'H', data, start)[0]
+    if count > MAX_IFD_ENTRIES:
+        raise ExifError("Implausible IFD entry count")
+
+    entries = {}
+    for index in range(count):
+        entry = start + 2 + index * 12
+        tag, field_type, components = _unpack(endian + 'HHL', data, entry)
+        # Skip maker notes and everything else so their pages are never touched
+        if tag not in WANTED_TAGS or field_type not in TIFF_TYPES:
+            continue
+
+        code, size = TIFF_TYPES[field_type]
+        length = size * components
+        if length <= 4:
+            value_offset = entry + 8
+        else:
+            value_offset = base + _unpack(endian + 'L', data, entry + 8)[0]
+        if value_offset + length > len(data):
+            continue
+
+        raw = data[value_offset:value_offset + length]
+        if field_type == 2:
+            entries[tag] = raw
+        elif tag == TAG_EXIF_IFD:
+            entries[tag] = _unpack(endian + 'L', raw, 0)[0]
+        else:
+            values = struct.unpack(endian + code * components, raw)
+            if field_type in (5, 10):
+                values = tuple(zip(values[::2], values[1::2]))
+            entries[tag] = values[0] if components == 1 else values
+
+    return entries
+
+
+def _unpack(fmt: str, data, offset: int) -> tuple:
+    """Unpack a field at an offset, reporting a truncated header as ExifError"""
+    if offset < 0 or offset + struct.calcsize(fmt) > len(data):
+        raise ExifError("Header truncated")
+    return struct.unpack_from(fmt, data, offset)
+
+
+def _text(value) -> Optional[str]:
+    """Decode a NUL-terminated ASCII field"""
+    if value is None:
+        return None
+    text = bytes(value).split(b'\x00', 1)[0].decode('ascii', errors='replace').strip()
+    return text or None
+
+
+def _rational(value) -> Optional[float]:
+    """Convert a (numerator, denominator) pair to float"""
+    if not value:
+        return None
+    if isinstance(value[0], tuple):
+        value = value[0]
+    numerator, denominator = value
+    return numerator / denominator if denominator else None
+
+
+def _parse_datetime(value: Optional[str], subsec: Optional[str]):
+    """Parse an EXIF timestamp into ISO text and a sortable camera-clock timestamp"""
+    if not value:
+        return None, None
+    try:
+        moment = datetime.datetime.strptime(value, '%Y:%m:%d %H:%M:%S')
+    except ValueError:
+        return None, None
+
+    fraction = 0.0
+    if subsec and subsec.isdigit():
+        fraction = int(subsec) / (10 ** len(subsec))
+
+    # Camera clocks carry no reliable zone; keep them as naive wall-clock seconds
+    timestamp = calendar.timegm(moment.timetuple()) + fraction
+    return moment.isoformat(), timestamp
@@ -0,0 +1,115 @@
+"""
+Image decoding helpers for the processing engine
+"""
+
+import os
+import struct
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+from shared.constants import SUPPORTED_RAW_EXTENSIONS, SUPPORTED_JPEG_EXTENSIONS
+
+
+# JPEG start-of-frame markers that carry image dimensions
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+# cv2 reduced-resolution decode flags by scale denominator
+_REDUCED_FLAGS = {
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def is_raw(path: str) -> bool:
+    """Check if a file is a supported RAW format"""
+    return os.path.splitext(path)[1].upper() in SUPPORTED_RAW_EXTENSIONS
+
+
+def is_jpeg(path: str) -> bool:
+    """Check if a file is a JPEG"""
+    return os.path.splitext(path)[1].upper() in SUPPORTED_JPEG_EXTENSIONS
+
+
+def jpeg_dimensions(data: bytes) -> Optional[Tuple[int, int]]:
+    """Read (width, height) from JPEG SOF header without decoding"""
+    offset = 2
+    while offset + 9 < len(data):
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+        if marker == 0xFF:
+            offset += 1
+            continue
+        length = struct.unpack('>H', data[offset + 2:offset + 4])[0]
+        if marker in _SOF_MARKERS:
+            height, width = struct.unpack('>HH', data[offset + 5:offset + 9])
+            return width, height
+        offset += 2 + length
+    return None
+
+
+def decode_jpeg(data: bytes, max_dimension: Optional[int] = None) -> Optional[np.ndarray]:
+    """Decode JPEG bytes, using libjpeg DCT scaling when a small result is enough"""
+    flag = cv2.IMREAD_COLOR
+    if max_dimension:
+        dimensions = jpeg_dimensions(data)
+        if dimensions:
+            longest = max(dimensions)
+            for scale in (8, 4, 2):
+                if longest // scale >= max_dimension:
+                    flag = _REDUCED_FLAGS[scale]
+                    break
+
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flag)
+
+
+def load_image(path: str, max_dimension: Optional[int] = None) -> Optional[np.ndarray]:
+    """Load a BGR image, preferring the embedded preview for RAW files"""
+    if is_raw(path):
+        image = _load_raw(path, max_dimension)
+    else:
+        with open(path, 'rb') as f:
+            image = decode_jpeg(f.read(), max_dimension)
+
+    if image is None or not max_dimension:
+        return image
+    return resize_to_fit(image, max_dimension)
+
+
+def resize_to_fit(image: np.ndarray, max_dimension: int) -> np.ndarray:
+    """Downscale so the longest edge is at most max_dimension"""
+    height, width = image.shape[:2]
+    longest = max(height, width)
+    if longest <= max_dimension:
+        return image
+
+    scale = max_dimension / longest
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+def _load_raw(path: str, max_dimension: Optional[int]) -> Optional[np.ndarray]:
+    """Decode a RAW file via its embedded JPEG, demosaicing only as a fallback"""
+    import rawpy
+
+    with rawpy.imread(path) as raw:
+        try:
+            thumb = raw.extract_thumb()
+        except (rawpy.LibRawNoThumbnailError, rawpy.LibRawUnsupportedThumbnailError):
+            thumb = None
+
+        if thumb is not None:
+            if thumb.format == rawpy.ThumbFormat.JPEG:
+                image = decode_jpeg(thumb.data, max_dimension)
+            else:
+                image = cv2.cvtColor(thumb.data, cv2.COLOR_RGB2BGR)
+
+            # Some bodies only embed a tiny thumbnail; demosaic those instead
+            if image is not None and (not max_dimension or max(image.shape[:2]) >= max_dimension // 2):
+                return image
+
+        rgb = raw.postprocess(half_size=True, use_camera_wb=True, no_auto_bright=False)
+        return cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
@@ -0,0 +1,723 @@
+"""
+Persistent priority job queue and process-pool scheduler for the processing pipeline
+"""
+
+import os
+import json
+import time
+import socket
+import sqlite3
+import logging
+import argparse
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, Iterable, List, Optional
+
+import cv2
+import numpy as np
+
+from shared.constants import ALL_SUPPORTED_EXTENSIONS, ProcessingStatus
+from processing.thumbnail_cache import ThumbnailCache
+from processing.unpacker import materialize_session
+
+
+# Per-file stages in dependency order, then the per-session grouping stage
+FILE_STAGES = ['exif', 'preview', 'quality', 'faces']
+SESSION_STAGES = ['grouping']
+STAGES = FILE_STAGES + SESSION_STAGES
+STAGE_RANK = {stage: rank for rank, stage in enumerate(STAGES)}
+
+QUALITY_PREVIEW_SIZE = 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    session TEXT NOT NULL,
+    path TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    stage_rank INTEGER NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    waiting_on INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    not_before REAL NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    enqueued_at REAL NOT NULL,
+    ready_at REAL,
+    started_at REAL,
+    finished_at REAL,
+    result TEXT,
+    error TEXT,
+    UNIQUE (path, stage)
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs (status, waiting_on, priority DESC, stage_rank, id);
+CREATE INDEX IF NOT EXISTS idx_jobs_lease ON jobs (status, lease_expires);
+CREATE INDEX IF NOT EXISTS idx_jobs_session ON jobs (session, stage);
+CREATE TABLE IF NOT EXISTS job_dependencies (
+    job_id INTEGER NOT NULL REFERENCES jobs (id),
+    depends_on INTEGER NOT NULL REFERENCES jobs (id),
+    hard INTEGER NOT NULL DEFAULT 1,
+    PRIMARY KEY (job_id, depends_on)
+);
+CREATE INDEX IF NOT EXISTS idx_dependencies_parent ON job_dependencies (depends_on);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL
+);
+"""
+
+
+class JobQueue:
+    """SQLite-backed job queue with priorities, dependencies and leases.
+
+    A job becomes claimable once every job it depends on has completed.
+    Soft dependencies only need to have finished, so one unreadable file
+    does not hold back the session-wide grouping.
+    Claiming leases it to one owner until `lease_expires`; results from an
+    owner whose lease has lapsed (and was handed to someone else) are
+    ignored, so a stage may run twice but is only recorded once. Jobs are
+    unique per (path, stage), which makes enqueueing idempotent.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.logger = logging.getLogger(__name__)
+
+        # Autocommit mode; writes use explicit IMMEDIATE transactions
+        self.conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def enqueue(self, session: str, path: str, stage: str, depends_on: Iterable[int] = (),
+                priority: int = 0, max_attempts: int = 3, hard: bool = True) -> int:
+        """Add a job unless it already exists; returns its id"""
+        depends_on = list(depends_on)
+        now = time.time()
+
+        with self._transaction():
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO jobs (session, path, stage, stage_rank, priority, status, "
+                "max_attempts, enqueued_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (session, path, stage, STAGE_RANK[stage], priority, ProcessingStatus.PENDING,
+                 max_attempts, now)
+            )
+            if not cursor.rowcount:
+                return self.conn.execute(
+                    "SELECT id FROM jobs WHERE path = ? AND stage = ?", (path, stage)
+                ).fetchone()['id']
+
+            job_id = cursor.lastrowid
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO job_dependencies (job_id, depends_on, hard) VALUES (?, ?, ?)",
+                [(job_id, parent, int(hard)) for parent in depends_on]
+            )
+
+            blocked = self._unfinished_parents(job_id)
+            if blocked['dead']:
+                self.conn.execute(
+                    "UPDATE jobs SET status = ?, error = 'dependency failed' WHERE id = ?",
+                    (ProcessingStatus.CANCELLED, job_id)
+                )
+            elif blocked['waiting']:
+                self.conn.execute("UPDATE jobs SET waiting_on = ? WHERE id = ?", (blocked['waiting'], job_id))
+            else:
+                self.conn.execute("UPDATE jobs SET ready_at = ? WHERE id = ?", (now, job_id))
+
+        return job_id
+
+    def enqueue_file(self, session: str, path: str, priority: int = 0, max_attempts: int = 3,
+                     size: Optional[int] = None, mtime: Optional[float] = None) -> List[int]:
+        """Add the per-file stage chain for one photo, remembering the file version it was queued for"""
+        job_ids = []
+        for stage in FILE_STAGES:
+            job_ids.append(self.enqueue(session, path, stage, job_ids[-1:], priority, max_attempts))
+        if size is not None and mtime is not None:
+            with self._transaction():
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO files (path, size, mtime) VALUES (?, ?, ?)", (path, size, mtime)
+                )
+        return job_ids
+
+    def refresh_file(self, path: str, size: int, mtime: float) -> bool:
+        """Rerun every stage of a file that changed since it was queued; True if it was requeued"""
+        with self._transaction():
+            row = self.conn.execute("SELECT size, mtime FROM files WHERE path = ?", (path,)).fetchone()
+            if row is not None and (row['size'], row['mtime']) == (size, mtime):
+                return False
+            self.conn.execute(
+                "INSERT OR REPLACE INTO files (path, size, mtime) VALUES (?, ?, ?)", (path, size, mtime)
+            )
+            if row is None:
+                return False
+
+            # Results of a lease still running are discarded once its owner reports back
+            marks = ', '.join('?' * len(FILE_STAGES))
+            self.conn.execute(
+                f"UPDATE jobs SET status = ?, attempts = 0, not_before = 0, error = NULL, result = NULL, "
+                f"ready_at = NULL, started_at = NULL, finished_at = NULL, lease_owner = NULL, "
+                f"lease_expires = NULL WHERE path = ? AND stage IN ({marks})",
+                [ProcessingStatus.PENDING, path] + FILE_STAGES
+            )
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, attempts = 0, ready_at = NULL WHERE stage = 'grouping' AND status = ? "
+                "AND session IN (SELECT session FROM jobs WHERE path = ?)",
+                (ProcessingStatus.PENDING, ProcessingStatus.COMPLETED, path)
+            )
+            self._recount_waiting()
+        return True
+
+    def enqueue_grouping(self, session: str, session_dir: str, priority: int = 0,
+                         max_attempts: int = 3) -> int:
+        """Add the session grouping job, after every file of the session has been analysed"""
+        faces = [row['id'] for row in self.conn.execute(
+            "SELECT id FROM jobs WHERE session = ? AND stage = 'faces'", (session,)
+        )]
+        return self.enqueue(session, session_dir, 'grouping', faces, priority, max_attempts, hard=False)
+
+    def claim(self, owner: str, limit: int, lease_seconds: float) -> List[Dict[str, Any]]:
+        """Lease up to `limit` ready jobs, highest priority and earliest stage first"""
+        now = time.time()
+
+        with self._transaction():
+            rows = [dict(row) for row in self.conn.execute(
+                "SELECT * FROM jobs WHERE status = ? AND waiting_on = 0 AND not_before <= ? "
+                "ORDER BY priority DESC, stage_rank, id LIMIT ?",
+                (ProcessingStatus.PENDING, now, limit)
+            )]
+            self.conn.executemany(
+                "UPDATE jobs SET status = ?, lease_owner = ?, lease_expires = ?, "
+                "attempts = attempts + 1, started_at = ? WHERE id = ?",
+                [(ProcessingStatus.IN_PROGRESS, owner, now + lease_seconds, now, row['id']) for row in rows]
+            )
+
+            for row in rows:
+                row['attempts'] += 1
+                row['inputs'] = {
+                    parent['stage']: json.loads(parent['result']) if parent['result'] else None
+                    for parent in self.conn.execute(
+                        "SELECT j.stage, j.result FROM job_dependencies d JOIN jobs j ON j.id = d.depends_on "
+                        "WHERE d.job_id = ? AND j.stage != 'faces'", (row['id'],)
+                    )
+                }
+
+        return rows
+
+    def renew(self, owner: str, job_ids: Iterable[int], lease_seconds: float):
+        """Extend the leases of jobs still running"""
+        expires = time.time() + lease_seconds
+        with self._transaction():
+            self.conn.executemany(
+                "UPDATE jobs SET lease_expires = ? WHERE id = ? AND lease_owner = ? AND status = ?",
+                [(expires, job_id, owner, ProcessingStatus.IN_PROGRESS) for job_id in job_ids]
+            )
+
+    def complete(self, job_id: int, owner: str, result: Any) -> bool:
+        """Record a result and release dependents; False if the lease was lost"""
+        now = time.time()
+
+        with self._transaction():
+            cursor = self.conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, result = ?, error = NULL, lease_owner = NULL, "
+                "lease_expires = NULL WHERE id = ? AND lease_owner = ? AND status = ?",
+                (ProcessingStatus.COMPLETED, now, json.dumps(result, default=_json_default), job_id, owner,
+                 ProcessingStatus.IN_PROGRESS)
+            )
+            if not cursor.rowcount:
+                return False
+
+            self.conn.execute(
+                "UPDATE jobs SET waiting_on = waiting_on - 1 "
+                "WHERE id IN (SELECT job_id FROM job_dependencies WHERE depends_on = ?)", (job_id,)
+            )
+            self.conn.execute(
+                "UPDATE jobs SET ready_at = ? WHERE waiting_on = 0 AND ready_at IS NULL AND status = ? "
+                "AND id IN (SELECT job_id FROM job_dependencies WHERE depends_on = ?)",
+                (now, ProcessingStatus.PENDING, job_id)
+            )
+        return True
+
+    def fail(self, job_id: int, owner: str, error: str, retry_delay: float = 5.0) -> bool:
+        """Schedule a retry with backoff, or fail the job (and its dependents) once attempts run out"""
+        with self._transaction():
+            row = self.conn.execute(
+                "SELECT attempts, max_attempts FROM jobs WHERE id = ? AND lease_owner = ? AND status = ?",
+                (job_id, owner, ProcessingStatus.IN_PROGRESS)
+            ).fetchone()
+            if row is None:
+                return False
+            self._release(job_id, row['attempts'], row['max_attempts'], error, retry_delay)
+        return True
+
+    def release_expired(self, retry_delay: float = 5.0) -> int:
+        """Return jobs whose lease lapsed (crashed or stuck worker) to the queue"""
+        with self._transaction():
+            rows = self.conn.execute(
+                "SELECT id, attempts, max_attempts, lease_owner FROM jobs WHERE status = ? AND lease_expires < ?",
+                (ProcessingStatus.IN_PROGRESS, time.time())
+            ).fetchall()
+            for row in rows:
+                self._release(row['id'], row['attempts'], row['max_attempts'],
+                              f"lease expired (owner {row['lease_owner']})", retry_delay)
+
+        if rows:
+            self.logger.warning(f"Released {len(rows)} jobs with expired leases")
+        return len(rows)
+
+    def retry_failed(self, session: Optional[str] = None) -> int:
+        """Reset failed and cancelled jobs so they run again"""
+        where = "status IN (?, ?)" + (" AND session = ?" if session else "")
+        params = [ProcessingStatus.FAILED, ProcessingStatus.CANCELLED] + ([session] if session else [])
+
+        with self._transaction():
+            sessions = [row['session'] for row in self.conn.execute(
+                f"SELECT DISTINCT session FROM jobs WHERE {where}", params
+            )]
+            cursor = self.conn.execute(
+                f"UPDATE jobs SET status = ?, attempts = 0, not_before = 0, error = NULL, ready_at = NULL "
+                f"WHERE {where}",
+                [ProcessingStatus.PENDING] + params
+            )
+            requeued = cursor.rowcount
+            # Sessions grouped without these files are grouped again once they finish
+            self.conn.executemany(
+                "UPDATE jobs SET status = ?, attempts = 0, ready_at = NULL WHERE session = ? "
+                "AND stage = 'grouping' AND status = ?",
+                [(ProcessingStatus.PENDING, session, ProcessingStatus.COMPLETED) for session in sessions]
+            )
+            self._recount_waiting()
+        return requeued
+
+    def bump(self, session: str, priority: int):
+        """Raise the priority of a session's unfinished jobs (e.g. it was opened for culling)"""
+        with self._transaction():
+            self.conn.execute(
+                "UPDATE jobs SET priority = MAX(priority, ?) WHERE session = ? AND status IN (?, ?)",
+                (priority, session, ProcessingStatus.PENDING, ProcessingStatus.IN_PROGRESS)
+            )
+
+    def depth(self) -> int:
+        """Number of unfinished jobs"""
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)",
+            (ProcessingStatus.PENDING, ProcessingStatus.IN_PROGRESS)
+        ).fetchone()[0]
+
+    def stage_report(self) -> List[Dict[str, Any]]:
+        """Per-stage counts, throughput, run time and queue latency"""
+        counts = {stage: {} for stage in STAGES}
+        for row in self.conn.execute("SELECT stage, status, COUNT(*) AS n FROM jobs GROUP BY stage, status"):
+            counts.setdefault(row['stage'], {})[row['status']] = row['n']
+
+        timings = {stage: [] for stage in STAGES}
+        for row in self.conn.execute(
+            "SELECT stage, ready_at, started_at, finished_at FROM jobs WHERE status = ?",
+            (ProcessingStatus.COMPLETED,)
+        ):
+            timings[row['stage']].append((row['ready_at'], row['started_at'], row['finished_at']))
+
+        report = []
+        for stage in STAGES:
+            done = timings[stage]
+            latencies = sorted(started - ready for ready, started, _ in done if ready is not None)
+            runtimes = [finished - started for _, started, finished in done]
+            span = (max(finished for _, _, finished in done) - min(started for _, started, _ in done)) if done else 0
+
+            report.append({
+                'stage': stage,
+                'pending': counts[stage].get(ProcessingStatus.PENDING, 0),
+                'in_progress': counts[stage].get(ProcessingStatus.IN_PROGRESS, 0),
+                'completed': len(done),
+                'failed': counts[stage].get(ProcessingStatus.FAILED, 0),
+                'cancelled': counts[stage].get(ProcessingStatus.CANCELLED, 0),
+                'throughput': len(done) / span if span > 0 else 0.0,
+                'mean_runtime': sum(runtimes) / len(runtimes) if runtimes else 0.0,
+                'mean_latency': sum(latencies) / len(latencies) if latencies else 0.0,
+                'p95_latency': latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0,
+            })
+        return report
+
+    def close(self):
+        """Close the database"""
+        self.conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        """Write transaction that takes the database lock up front"""
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def _recount_waiting(self):
+        """Recompute waiting_on of pending jobs after resets; runs inside a transaction"""
+        # Recount once all resets are visible; a requeued parent blocks again
+        self.conn.execute(
+            "UPDATE jobs SET waiting_on = (SELECT COUNT(*) FROM job_dependencies d "
+            "JOIN jobs p ON p.id = d.depends_on WHERE d.job_id = jobs.id "
+            "AND (p.status IN (?, ?) OR (d.hard = 1 AND p.status != ?))) WHERE status = ?",
+            (ProcessingStatus.PENDING, ProcessingStatus.IN_PROGRESS, ProcessingStatus.COMPLETED,
+             ProcessingStatus.PENDING)
+        )
+        self.conn.execute(
+            "UPDATE jobs SET ready_at = ? WHERE status = ? AND waiting_on = 0 AND ready_at IS NULL",
+            (time.time(), ProcessingStatus.PENDING)
+        )
+
+    def _unfinished_parents(self, job_id: int) -> Dict[str, int]:
+        """Count dependencies still to run and ones that can no longer succeed"""
+        row = self.conn.execute(
+            "SELECT SUM(p.status IN (?, ?)) AS waiting, SUM(d.hard = 1 AND p.status IN (?, ?)) AS dead "
+            "FROM job_dependencies d JOIN jobs p ON p.id = d.depends_on WHERE d.job_id = ?",
+            (ProcessingStatus.PENDING, ProcessingStatus.IN_PROGRESS,
+             ProcessingStatus.FAILED, ProcessingStatus.CANCELLED, job_id)
+        ).fetchone()
+        return {'waiting': row['waiting'] or 0, 'dead': row['dead'] or 0}
+
+    def _release(self, job_id: int, attempts: int, max_attempts: int, error: str, retry_delay: float):
+        """Requeue with exponential backoff or mark failed; runs inside a transaction"""
+        if attempts < max_attempts:
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, lease_owner = NULL, lease_expires = NULL, error = ?, "
+                "not_before = ? WHERE id = ?",
+                (ProcessingStatus.PENDING, error, time.time() + retry_delay * 2 ** (attempts - 1), job_id)
+            )
+            return
+
+        self.conn.execute(
+            "UPDATE jobs SET status = ?, lease_owner = NULL, lease_expires = NULL, error = ?, finished_at = ? "
+            "WHERE id = ?",
+            (ProcessingStatus.FAILED, error, time.time(), job_id)
+        )
+        # Everything hard-wired downstream of a failed job can never become ready
+        finished = [row['id'] for row in self.conn.execute(
+            "WITH RECURSIVE downstream(id) AS ("
+            "  SELECT ? UNION SELECT d.job_id FROM job_dependencies d"
+            "  JOIN downstream ON d.depends_on = downstream.id WHERE d.hard = 1"
+            ") SELECT id FROM downstream", (job_id,)
+        )]
+        marks = ', '.join('?' * len(finished))
+        self.conn.execute(
+            f"UPDATE jobs SET status = ?, error = 'dependency failed' WHERE id IN ({marks}) AND status = ?",
+            [ProcessingStatus.CANCELLED] + finished + [ProcessingStatus.PENDING]
+        )
+
+        # Soft dependents only waited for these jobs to finish, whatever the outcome
+        for row in self.conn.execute(
+            f"SELECT job_id, COUNT(*) AS n FROM job_dependencies WHERE hard = 0 AND depends_on IN ({marks}) "
+            f"GROUP BY job_id", finished
+        ).fetchall():
+            self.conn.execute(
+                "UPDATE jobs SET waiting_on = waiting_on - ?, "
+                "ready_at = CASE WHEN waiting_on - ? = 0 THEN ? ELSE ready_at END WHERE id = ? AND status = ?",
+                (row['n'], row['n'], time.time(), row['job_id'], ProcessingStatus.PENDING)
+            )
+
+
+class JobScheduler:
+    """Feeds queued jobs to a process pool sized to the machine.
+
+    New files are picked up from the incoming share as soon as they stop
+    changing, so analysis of early files overlaps the upload of later ones.
+    Intake stops while the queue holds more than `max_queued` unfinished
+    jobs, and at most two jobs per worker are leased at a time so leases
+    are not burned on work that is only waiting for a free process.
+    """
+
+    def __init__(self, queue: JobQueue, catalog_path: str, cache_dir: str,
+                 workers: Optional[int] = None, lease_seconds: float = 300, retry_delay: float = 5,
+                 max_queued: int = 20000, settle_seconds: float = 10, min_sharpness: Optional[float] = None,
+                 eviction_interval: float = 300):
+        self.queue = queue
+        self.catalog_path = catalog_path
+        self.cache_dir = cache_dir
+        self.workers = workers or os.cpu_count() or 1
+        self.lease_seconds = lease_seconds
+        self.retry_delay = retry_delay
+        self.max_queued = max_queued
+        self.settle_seconds = settle_seconds
+        self.min_sharpness = min_sharpness
+        self.eviction_interval = eviction_interval
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.logger = logging.getLogger(__name__)
+
+        self._enqueued = set()
+        self._grouped = set()
+
+        # Workers never evict; the disk budget is enforced here over the whole directory
+        self.thumbnails = ThumbnailCache(cache_dir)
+
+    def scan(self, incoming_dir: str) -> int:
+        """Enqueue settled files of every session; returns the number of new files"""
+        budget = (self.max_queued - self.queue.depth()) // len(FILE_STAGES)
+        added = 0
+
+        for session in sorted(os.listdir(incoming_dir)):
+            session_dir = os.path.join(incoming_dir, session)
+            if session_dir in self._grouped or not os.path.isdir(session_dir):
+                continue
+
+            # The manifest is written last, so with it every file is complete
+            manifest_sizes = self._manifest_sizes(session_dir)
+            complete = manifest_sizes is not None
+            # Packed files and content stored by another agent only appear once materialised
+            deferred = materialize_session(session_dir) > 0
+            now = time.time()
+
+            for name in sorted(os.listdir(session_dir)):
+                path = os.path.join(session_dir, name)
+                if os.path.splitext(name)[1].upper() not in ALL_SUPPORTED_EXTENSIONS:
+                    continue
+                if path in self._enqueued and not complete:
+                    continue
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+
+                if complete:
+                    expected = manifest_sizes.get(name)
+                    if expected is not None and stat.st_size != expected:
+                        self.logger.warning(f"Skipping {path}: {stat.st_size} bytes, manifest says {expected}")
+                        continue
+                    # A transfer retry may have rewritten a file after it settled and was queued
+                    if path in self._enqueued:
+                        if self.queue.refresh_file(path, stat.st_size, stat.st_mtime):
+                            self.logger.info(f"{path} changed after it was queued, processing it again")
+                        continue
+
+                if budget <= 0:
+                    deferred = True
+                    continue
+                if not complete and now - stat.st_mtime < self.settle_seconds:
+                    deferred = True
+                    continue
+
+                self.queue.enqueue_file(session, path, size=stat.st_size, mtime=stat.st_mtime)
+                # Jobs left by an earlier scheduler run may be for an older version of the file
+                self.queue.refresh_file(path, stat.st_size, stat.st_mtime)
+                self._enqueued.add(path)
+                budget -= 1
+                added += 1
+
+            if complete and not deferred:
+                self.queue.enqueue_grouping(session, session_dir)
+                self._grouped.add(session_dir)
+
+        if budget <= 0:
+            self.logger.info(f"Queue above {self.max_queued} jobs, deferring new files")
+        return added
+
+    def _manifest_sizes(self, session_dir: str) -> Optional[Dict[str, int]]:
+        """File sizes from the session manifest, or None while the session is still uploading"""
+        try:
+            with open(os.path.join(session_dir, 'manifest.json')) as f:
+                files = json.load(f).get('files', {})
+        except (OSError, ValueError):
+            return None
+        return {name: entry['size'] for name, entry in files.items() if entry.get('size') is not None}
+
+    def run(self, incoming_dir: Optional[str] = None, poll_interval: float = 2.0,
+            report_interval: float = 60.0, stop_when_idle: bool = False):
+        """Process jobs until interrupted (or until the queue drains with stop_when_idle)"""
+        self.logger.info(f"Scheduler {self.owner} starting with {self.workers} workers")
+        last_report = last_eviction = time.time()
+
+        while True:
+            in_flight = {}
+            executor = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker, initargs=(self.catalog_path, self.cache_dir, self.min_sharpness)
+            )
+            try:
+                last_scan = last_renew = 0.0
+                while True:
+                    now = time.time()
+                    if incoming_dir and now - last_scan >= poll_interval:
+                        self.scan(incoming_dir)
+                        self.queue.release_expired(self.retry_delay)
+                        last_scan = now
+                    if in_flight and now - last_renew >= self.lease_seconds / 3:
+                        self.queue.renew(self.owner, [job['id'] for job in in_flight.values()], self.lease_seconds)
+                        last_renew = now
+                    if now - last_report >= report_interval:
+                        self.log_report()
+                        last_report = now
+                    if now - last_eviction >= self.eviction_interval:
+                        self.thumbnails.rescan()
+                        last_eviction = now
+
+                    free = self.workers * 2 - len(in_flight)
+                    if free > 0:
+                        for job in self.queue.claim(self.owner, free, self.lease_seconds):
+                            future = executor.submit(_run_job, job['stage'], job['path'], job['session'], job['inputs'])
+                            in_flight[future] = job
+
+                    if not in_flight:
+                        if stop_when_idle and self.queue.depth() == 0:
+                            self.thumbnails.rescan()
+                            self.log_report()
+                            return
+                        time.sleep(poll_interval)
+                        continue
+
+                    done, _ = wait(in_flight, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        # Stays in flight if the pool broke, so the handler below fails it
+                        self._finish(in_flight[future], future)
+                        del in_flight[future]
+
+            except BrokenProcessPool:
+                # A worker died (e.g. a decoder crash); its jobs count as failed attempts
+                self.logger.error(f"Worker pool broke, failing {len(in_flight)} in-flight jobs and restarting")
+                for job in in_flight.values():
+                    self.queue.fail(job['id'], self.owner, "worker process died", self.retry_delay)
+            finally:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    def log_report(self):
+        """Log per-stage throughput and queue latency"""
+        self.logger.info("Stage          done  pending  failed   jobs/s   run ms  wait ms (mean/p95)")
+        for entry in self.queue.stage_report():
+            self.logger.info(
+                f"  {entry['stage']:<10} {entry['completed']:7d} {entry['pending'] + entry['in_progress']:8d} "
+                f"{entry['failed'] + entry['cancelled']:7d} {entry['throughput']:8.1f} "
+                f"{entry['mean_runtime'] * 1000:8.0f} {entry['mean_latency'] * 1000:8.0f}/"
+                f"{entry['p95_latency'] * 1000:.0f}"
+            )
+
+    def _finish(self, job: Dict[str, Any], future):
+        """Record the outcome of one job"""
+        try:
+            result = future.result()
+        except BrokenProcessPool:
+            raise
+        except Exception as e:
+            self.logger.warning(
+                f"{job['stage']} failed for {job['path']} (attempt {job['attempts']}/{job['max_attempts']}): {e}"
+            )
+            self.queue.fail(job['id'], self.owner, str(e), self.retry_delay)
+            return
+
+        if not self.queue.complete(job['id'], self.owner, result):
+            self.logger.warning(f"Lease lost for {job['stage']} of {job['path']}, result discarded")
+
+
+# Per-process stage state, created once by the pool initializer
+_worker = None
+
+
+class _StageWorker:
+    """Loaded models and stores of one worker process"""
+
+    def __init__(self, catalog_path: str, cache_dir: str, min_sharpness: Optional[float]):
+        from processing.catalog import PhotoCatalog
+        from processing.face_detection import FaceDetector
+        from processing.segmentation import Segmenter
+
+        cv2.setNumThreads(1)
+        self.catalog = PhotoCatalog(catalog_path)
+        self.thumbnails = ThumbnailCache(cache_dir, max_disk_bytes=None)
+        self.detector = FaceDetector()
+        self.segmenter = Segmenter()
+        self.min_sharpness = min_sharpness
+
+    def exif(self, path: str, session: str, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        """Index capture metadata into the catalog"""
+        row = self.catalog.index_file(session, path)
+        if row is None:
+            # Failing the job cancels the file's later stages once its retries run out
+            raise FileNotFoundError(f"{path} no longer exists")
+        return {'capture_ts': row['capture_ts'], 'exif_error': row['exif_error']}
+
+    def preview(self, path: str, session: str, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the thumbnail pyramid"""
+        return {'key': self.thumbnails.generate(path)}
+
+    def quality(self, path: str, session: str, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        """Sharpness from the cached preview instead of decoding the original again"""
+        data = self.thumbnails.get(path, QUALITY_PREVIEW_SIZE, key=inputs['preview']['key'])
+        gray = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_GRAYSCALE)
+        sharpness = float(cv2.Laplacian(gray, cv2.CV_64F).var())
+        rejected = self.min_sharpness is not None and sharpness < self.min_sharpness
+        return {'sharpness': sharpness, 'rejected': rejected}
+
+    def faces(self, path: str, session: str, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        """Face and eye state, skipped for photos rejected on quality"""
+        if inputs['quality']['rejected']:
+            return {'skipped': 'blurry', 'faces': [], 'closed_eyes': False}
+        result = self.detector.detect(path)
+        result.pop('path', None)
+        result.pop('timings', None)
+        return result
+
+    def grouping(self, path: str, session: str, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        """Segment the whole session into scenes and bursts"""
+        scenes = self.segmenter.segment(self.catalog.session_photos(session))
+        self.catalog.store_segments(session, scenes)
+        return {'scenes': len(scenes), 'bursts': sum(len(scene['bursts']) for scene in scenes)}
+
+
+def _init_worker(catalog_path: str, cache_dir: str, min_sharpness: Optional[float]):
+    """Load stage state once per worker process"""
+    global _worker
+    _worker = _StageWorker(catalog_path, cache_dir, min_sharpness)
+
+
+def _run_job(stage: str, path: str, session: str, inputs: Dict[str, Any]) -> Dict[str, Any]:
+    """Run one stage in a worker; every stage overwrites its previous output, so retries are safe"""
+    return getattr(_worker, stage)(path, session, inputs)
+
+
+def _json_default(value):
+    """Serialize numpy scalars in stage results"""
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Not JSON serializable: {type(value).__name__}")
+
+
+def main():
+    """Run the scheduler over an incoming directory, or manage its queue"""
+    parser = argparse.ArgumentParser(description="Pickly processing job scheduler")
+    parser.add_argument('queue_db', help="Job queue database")
+    parser.add_argument('--catalog', help="Photo catalog database")
+    parser.add_argument('--cache-dir', help="Thumbnail cache directory")
+    parser.add_argument('--incoming', help="Incoming session directory to watch")
+    parser.add_argument('--workers', type=int, help="Worker processes (default: CPU count)")
+    parser.add_argument('--min-sharpness', type=float, help="Skip face detection below this sharpness")
+    parser.add_argument('--once', action='store_true', help="Exit when the queue is drained")
+    parser.add_argument('--report', action='store_true', help="Print the stage report and exit")
+    parser.add_argument('--retry-failed', action='store_true', help="Requeue failed jobs and exit")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    queue = JobQueue(args.queue_db)
+    try:
+        if args.retry_failed:
+            print(f"Requeued {queue.retry_failed()} jobs")
+        elif args.report:
+            for entry in queue.stage_report():
+                print(json.dumps(entry))
+        else:
+            if not (args.catalog and args.cache_dir and args.incoming):
+                parser.error("--catalog, --cache-dir and --incoming are required to run the scheduler")
+            scheduler = JobScheduler(queue, args.catalog, args.cache_dir, args.workers,
+                                     min_sharpness=args.min_sharpness)
+            scheduler.run(args.incoming, stop_when_idle=args.once)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        queue.close()
+
+
+if __name__ == "__main__":
+    main()
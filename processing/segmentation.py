@@ -0,0 +1,141 @@
+"""
+Burst and scene segmentation over capture timestamps
+"""
+
+import itertools
+import logging
+from collections import defaultdict
+from typing import Callable, Dict, Any, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from processing.image_loader import load_image
+
+
+DEFAULT_BURST_GAP = 1.0   # seconds between frames of one burst
+DEFAULT_SCENE_GAP = 30.0  # seconds between scenes
+
+
+class Segmenter:
+    """Splits a session into scenes and bursts per camera.
+
+    Photos are sorted by (camera, capture time) once and split with a single
+    pass over consecutive gaps. When a histogram threshold is set, frames that
+    are close in time but visually different (e.g. a recomposed shot within a
+    second) start a new burst; histograms are computed once per photo and only
+    compared with the previous frame, so the pass stays linear.
+    """
+
+    def __init__(self, burst_gap: float = DEFAULT_BURST_GAP, scene_gap: float = DEFAULT_SCENE_GAP,
+                 histogram_threshold: Optional[float] = None,
+                 histogram_loader: Optional[Callable[[str], Optional[np.ndarray]]] = None):
+        self.burst_gap = burst_gap
+        self.scene_gap = scene_gap
+        self.histogram_threshold = histogram_threshold
+        self.histogram_loader = histogram_loader or load_histogram
+        self.logger = logging.getLogger(__name__)
+
+    def segment(self, photos: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Group catalog rows into scenes, each holding a list of bursts (lists of rows)"""
+        by_camera = defaultdict(list)
+        undated = []
+        for photo in photos:
+            if photo.get('capture_ts') is None:
+                undated.append(photo)
+            else:
+                by_camera[_camera_key(photo)].append(photo)
+
+        scenes = []
+        for camera, camera_photos in sorted(by_camera.items()):
+            camera_photos.sort(key=lambda photo: (photo['capture_ts'], photo['filename']))
+            scenes.extend(self._split(camera, camera_photos))
+
+        # Without a timestamp every photo stands alone
+        for photo in sorted(undated, key=lambda photo: photo['filename']):
+            scenes.append(_scene(_camera_key(photo), [[photo]]))
+
+        scenes.sort(key=lambda scene: (scene['start_ts'] is None, scene['start_ts'] or 0, scene['camera']))
+        for index, scene in enumerate(scenes):
+            scene['id'] = index
+
+        bursts = sum(len(scene['bursts']) for scene in scenes)
+        largest = max((len(burst) for scene in scenes for burst in scene['bursts']), default=0)
+        self.logger.info(
+            f"Segmented {len(photos)} photos into {len(scenes)} scenes and {bursts} bursts "
+            f"(largest burst: {largest})"
+        )
+        return scenes
+
+    def _split(self, camera: str, photos: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Single pass over one camera's time-sorted photos"""
+        scenes = []
+        bursts = [[photos[0]]]
+        previous = photos[0]
+        previous_histogram = self._histogram(previous)
+
+        for photo in photos[1:]:
+            gap = photo['capture_ts'] - previous['capture_ts']
+            histogram = self._histogram(photo)
+
+            if gap > self.scene_gap:
+                scenes.append(_scene(camera, bursts))
+                bursts = [[photo]]
+            elif gap > self.burst_gap or self._looks_different(previous_histogram, histogram):
+                bursts.append([photo])
+            else:
+                bursts[-1].append(photo)
+
+            previous, previous_histogram = photo, histogram
+
+        scenes.append(_scene(camera, bursts))
+        return scenes
+
+    def _histogram(self, photo: Dict[str, Any]) -> Optional[np.ndarray]:
+        """Histogram for confirmation, only when enabled"""
+        if self.histogram_threshold is None:
+            return None
+        try:
+            return self.histogram_loader(photo['path'])
+        except Exception as e:
+            self.logger.warning(f"Histogram failed for {photo['path']}: {e}")
+            return None
+
+    def _looks_different(self, first: Optional[np.ndarray], second: Optional[np.ndarray]) -> bool:
+        """Bhattacharyya distance check between consecutive frames"""
+        if first is None or second is None:
+            return False
+        return cv2.compareHist(first, second, cv2.HISTCMP_BHATTACHARYYA) > self.histogram_threshold
+
+
+def load_histogram(path: str, size: int = 256) -> Optional[np.ndarray]:
+    """Normalized hue/saturation histogram of a small preview"""
+    image = load_image(path, size)
+    if image is None:
+        return None
+    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+    histogram = cv2.calcHist([hsv], [0, 1], None, [30, 32], [0, 180, 0, 256])
+    return cv2.normalize(histogram, histogram).flatten()
+
+
+def pairs_within_bursts(scenes: List[Dict[str, Any]]) -> Iterator[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """Candidate pairs for duplicate comparison, restricted to each burst"""
+    for scene in scenes:
+        for burst in scene['bursts']:
+            yield from itertools.combinations(burst, 2)
+
+
+def _camera_key(photo: Dict[str, Any]) -> str:
+    """Identify the body that took a photo"""
+    return photo.get('camera_serial') or photo.get('camera_model') or 'unknown'
+
+
+def _scene(camera: str, bursts: List[List[Dict[str, Any]]]) -> Dict[str, Any]:
+    """Build a scene record"""
+    return {
+        'id': None,
+        'camera': camera,
+        'start_ts': bursts[0][0].get('capture_ts'),
+        'end_ts': bursts[-1][-1].get('capture_ts'),
+        'bursts': bursts,
+    }
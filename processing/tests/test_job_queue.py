@@ -0,0 +1,139 @@
+"""
+State-machine tests for the processing JobQueue
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from shared.constants import ProcessingStatus
+from processing.scheduler import JobQueue, FILE_STAGES
+
+
+class JobQueueTest(unittest.TestCase):
+    """Drives a temp-file queue through claims, failures, leases and retries"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.queue = JobQueue(os.path.join(self.tmp_dir, 'jobs.db'))
+
+    def tearDown(self):
+        self.queue.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def job(self, job_id):
+        """Current row of one job"""
+        return dict(self.queue.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def run_stage(self, stage, owner='worker'):
+        """Claim the one ready job, check its stage and complete it"""
+        jobs = self.queue.claim(owner, 1, 60)
+        self.assertEqual([job['stage'] for job in jobs], [stage])
+        self.assertTrue(self.queue.complete(jobs[0]['id'], owner, {'stage': stage}))
+        return jobs[0]
+
+    def fail_to_exhaustion(self, job_id, owner='worker'):
+        """Fail a job on every attempt it has"""
+        for attempt in range(self.job(job_id)['max_attempts']):
+            [job] = self.queue.claim(owner, 1, 60)
+            self.assertEqual(job['id'], job_id)
+            self.assertEqual(job['attempts'], attempt + 1)
+            self.assertTrue(self.queue.fail(job_id, owner, 'unreadable', retry_delay=0))
+
+    def test_stages_run_in_order_with_inputs(self):
+        ids = self.queue.enqueue_file('s1', '/in/a.jpg')
+        self.assertEqual([self.job(i)['waiting_on'] for i in ids], [0, 1, 1, 1])
+
+        self.run_stage('exif')
+        self.assertEqual(self.job(ids[1])['waiting_on'], 0)
+        preview = self.run_stage('preview')
+        self.assertEqual(preview['inputs'], {'exif': {'stage': 'exif'}})
+        self.run_stage('quality')
+        self.run_stage('faces')
+
+        self.assertEqual({self.job(i)['status'] for i in ids}, {ProcessingStatus.COMPLETED})
+        self.assertEqual(self.queue.depth(), 0)
+
+    def test_failure_cancels_hard_dependents_and_releases_grouping(self):
+        good = self.queue.enqueue_file('s1', '/in/a.jpg', max_attempts=2)
+        bad = self.queue.enqueue_file('s1', '/in/b.jpg', priority=-1, max_attempts=2)
+        grouping = self.queue.enqueue_grouping('s1', '/in')
+        self.assertEqual(self.job(grouping)['waiting_on'], 2)
+
+        # The higher priority file runs its whole chain first
+        for job_id in good:
+            [job] = self.queue.claim('worker', 1, 60)
+            self.assertEqual(job['id'], job_id)
+            self.assertTrue(self.queue.complete(job_id, 'worker', {}))
+        self.assertEqual(self.job(grouping)['waiting_on'], 1)
+
+        self.fail_to_exhaustion(bad[0])
+        self.assertEqual(self.job(bad[0])['status'], ProcessingStatus.FAILED)
+        self.assertEqual([self.job(i)['status'] for i in bad[1:]], [ProcessingStatus.CANCELLED] * 3)
+
+        # Grouping only waited for the file to finish, whatever the outcome
+        self.assertEqual(self.job(grouping)['waiting_on'], 0)
+        self.assertIsNotNone(self.job(grouping)['ready_at'])
+        self.run_stage('grouping')
+
+    def test_expired_lease_is_requeued_and_stale_result_ignored(self):
+        ids = self.queue.enqueue_file('s1', '/in/a.jpg')
+        [job] = self.queue.claim('crashed', 1, -1)
+        self.assertEqual(self.queue.release_expired(retry_delay=0), 1)
+
+        released = self.job(ids[0])
+        self.assertEqual(released['status'], ProcessingStatus.PENDING)
+        self.assertIsNone(released['lease_owner'])
+        self.assertIn('lease expired', released['error'])
+
+        [again] = self.queue.claim('worker', 1, 60)
+        self.assertEqual((again['id'], again['attempts']), (job['id'], 2))
+        self.assertFalse(self.queue.complete(job['id'], 'crashed', {}))
+        self.assertFalse(self.queue.fail(job['id'], 'crashed', 'late'))
+        self.assertTrue(self.queue.complete(job['id'], 'worker', {}))
+        self.assertEqual(self.job(ids[1])['waiting_on'], 0)
+
+    def test_retry_failed_resets_chain_and_regroups(self):
+        good = self.queue.enqueue_file('s1', '/in/a.jpg', max_attempts=1)
+        bad = self.queue.enqueue_file('s1', '/in/b.jpg', priority=-1, max_attempts=1)
+        grouping = self.queue.enqueue_grouping('s1', '/in')
+
+        for job_id in good:
+            [job] = self.queue.claim('worker', 1, 60)
+            self.assertEqual(job['id'], job_id)
+            self.assertTrue(self.queue.complete(job_id, 'worker', {}))
+        self.fail_to_exhaustion(bad[0])
+        self.run_stage('grouping')
+
+        self.assertEqual(self.queue.retry_failed('s1'), 4)
+        self.assertEqual([self.job(i)['status'] for i in bad], [ProcessingStatus.PENDING] * 4)
+        self.assertEqual([self.job(i)['waiting_on'] for i in bad], [0, 1, 1, 1])
+        self.assertEqual(self.job(bad[0])['attempts'], 0)
+        self.assertEqual(self.job(grouping)['status'], ProcessingStatus.PENDING)
+        self.assertEqual(self.job(grouping)['waiting_on'], 1)
+        self.assertEqual({self.job(i)['status'] for i in good}, {ProcessingStatus.COMPLETED})
+
+        for stage in FILE_STAGES:
+            self.run_stage(stage)
+        self.run_stage('grouping')
+        self.assertEqual(self.queue.depth(), 0)
+
+    def test_refresh_file_requeues_changed_file(self):
+        ids = self.queue.enqueue_file('s1', '/in/a.jpg', size=100, mtime=1.0)
+        grouping = self.queue.enqueue_grouping('s1', '/in')
+        for stage in FILE_STAGES + ['grouping']:
+            self.run_stage(stage)
+
+        self.assertFalse(self.queue.refresh_file('/in/a.jpg', 100, 1.0))
+        self.assertTrue(self.queue.refresh_file('/in/a.jpg', 200, 2.0))
+        self.assertEqual([self.job(i)['status'] for i in ids], [ProcessingStatus.PENDING] * 4)
+        self.assertEqual([self.job(i)['waiting_on'] for i in ids], [0, 1, 1, 1])
+        self.assertEqual(self.job(grouping)['waiting_on'], 1)
+
+        for stage in FILE_STAGES + ['grouping']:
+            self.run_stage(stage)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,366 @@
+"""
+Disk-backed thumbnail pyramid cache with in-memory LRU
+"""
+
+import os
+import sys
+import time
+import shutil
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import cv2
+
+from shared.constants import ALL_SUPPORTED_EXTENSIONS, THUMBNAIL_SIZES
+from processing.image_loader import load_image, resize_to_fit
+from processing.unpacker import materialize_session
+
+
+INCOMPLETE_GRACE_SECONDS = 3600
+MAX_KNOWN_KEYS = 10000
+
+
+class ThumbnailCache:
+    """Content-addressed cache of WebP previews in several sizes.
+
+    Each image is decoded once and downscaled into every configured size
+    (largest first), so later requests for any size are served from disk or
+    memory without touching the RAW again. Entries are keyed by a digest of
+    the file content, so renamed or re-ingested copies of the same image
+    share one pyramid whether or not their session has finished. Sizes at or
+    above the source resolution are stored once and hardlinked. With
+    `max_disk_bytes=None` the cache never evicts; another process sharing
+    the directory is then expected to call `rescan`.
+    """
+
+    def __init__(self, cache_dir: str, sizes: List[int] = None,
+                 max_disk_bytes: Optional[int] = 5 * 1024 * 1024 * 1024,
+                 max_memory_bytes: int = 64 * 1024 * 1024,
+                 quality: int = 80):
+        self.cache_dir = cache_dir
+        self.sizes = sorted(sizes or THUMBNAIL_SIZES, reverse=True)
+        self.max_disk_bytes = max_disk_bytes
+        self.max_memory_bytes = max_memory_bytes
+        self.quality = quality
+        self.logger = logging.getLogger(__name__)
+
+        self._lock = threading.Lock()
+        self._memory: OrderedDict = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_index: Dict[str, List] = {}  # key -> [bytes, last_access]
+        self._disk_bytes = 0
+        self._generating: Dict[str, List] = {}  # key -> [lock, callers using it]
+        self._known_keys: OrderedDict = OrderedDict()  # path -> (size, mtime_ns, key)
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+
+    def get(self, image_path: str, size: int, key: Optional[str] = None) -> bytes:
+        """Return the WebP preview of an image, generating the pyramid on demand"""
+        if size not in self.sizes:
+            raise ValueError(f"Unsupported thumbnail size: {size}")
+
+        key = key or self.key_for(image_path)
+
+        data = self._memory_get(key, size)
+        if data is not None:
+            return data
+
+        if not self._on_disk(key):
+            self.generate(image_path, key)
+
+        try:
+            with open(self._entry_path(key, size), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            # Evicted between the index check and the read
+            with self._lock:
+                self._disk_index.pop(key, None)
+            self.generate(image_path, key)
+            with open(self._entry_path(key, size), 'rb') as f:
+                data = f.read()
+
+        self._touch(key)
+        self._memory_put(key, size, data)
+        return data
+
+    def generate(self, image_path: str, key: Optional[str] = None) -> str:
+        """Build every size for an image once; concurrent callers wait for the first"""
+        key = key or self.key_for(image_path)
+
+        with self._lock:
+            slot = self._generating.setdefault(key, [threading.Lock(), 0])
+            slot[1] += 1
+
+        try:
+            with slot[0]:
+                if self._on_disk(key):
+                    return key
+
+                started = time.time()
+                image = load_image(image_path, self.sizes[0])
+                if image is None:
+                    raise ValueError(f"Cannot decode image: {image_path}")
+
+                entry_dir = self._entry_dir(key)
+                os.makedirs(entry_dir, exist_ok=True)
+
+                native_path = None
+                for size in self.sizes:
+                    path = self._entry_path(key, size)
+                    if size >= max(image.shape[:2]):
+                        # Levels at or above the source resolution are all the source itself
+                        if native_path:
+                            self._link_level(native_path, path)
+                            continue
+                        native_path = path
+                    else:
+                        # Each level is downscaled from the previous one, not from the source
+                        image = resize_to_fit(image, size)
+                    self._write_level(path, image, image_path)
+                total = self._entry_bytes(key)
+
+                with self._lock:
+                    # Another process sharing the directory may have indexed it meanwhile
+                    if key not in self._disk_index:
+                        self._disk_index[key] = [total, time.time()]
+                        self._disk_bytes += total
+
+                self.logger.debug(f"Generated thumbnails for {os.path.basename(image_path)} in {time.time() - started:.2f}s")
+        finally:
+            # Dropped by the last caller, also after a decode failure, so the lock
+            # table does not grow with bad files and waiters keep sharing one lock
+            with self._lock:
+                slot[1] -= 1
+                if not slot[1]:
+                    del self._generating[key]
+
+        self._evict()
+        return key
+
+    def warm_session(self, session_dir: str, workers: Optional[int] = None) -> int:
+        """Pre-generate thumbnails for every image in a completed session directory"""
+        images = [
+            os.path.join(session_dir, name) for name in sorted(os.listdir(session_dir))
+            if os.path.splitext(name)[1].upper() in ALL_SUPPORTED_EXTENSIONS
+        ]
+
+        started = time.time()
+        generated = 0
+
+        # OpenCV releases the GIL while decoding and resizing
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+            futures = {
+                executor.submit(self.generate, path): path
+                for path in images
+            }
+            for future, path in futures.items():
+                try:
+                    future.result()
+                    generated += 1
+                except Exception as e:
+                    self.logger.error(f"Thumbnail generation failed for {path}: {e}")
+
+        self.logger.info(
+            f"Warmed {generated}/{len(images)} thumbnails for {os.path.basename(session_dir)} "
+            f"in {time.time() - started:.1f}s"
+        )
+        return generated
+
+    def watch(self, incoming_dir: str, poll_interval: float = 10):
+        """Warm each session as soon as its manifest appears (written at session end)"""
+        warmed = set()
+        self.logger.info(f"Watching {incoming_dir} for completed sessions")
+
+        while True:
+            try:
+                for name in sorted(os.listdir(incoming_dir)):
+                    session_dir = os.path.join(incoming_dir, name)
+                    if session_dir in warmed:
+                        continue
+                    if os.path.exists(os.path.join(session_dir, 'manifest.json')):
+                        if materialize_session(session_dir):
+                            continue
+                        self.warm_session(session_dir)
+                        warmed.add(session_dir)
+            except Exception as e:
+                self.logger.error(f"Error scanning {incoming_dir}: {e}")
+
+            time.sleep(poll_interval)
+
+    def key_for(self, image_path: str) -> str:
+        """Content key of an image: a BLAKE2 digest, remembered while the file is unchanged"""
+        stat = os.stat(image_path)
+        with self._lock:
+            known = self._known_keys.get(image_path)
+            if known and known[:2] == (stat.st_size, stat.st_mtime_ns):
+                self._known_keys.move_to_end(image_path)
+                return known[2]
+
+        digest = hashlib.blake2b(digest_size=20)
+        with open(image_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        key = digest.hexdigest()
+
+        with self._lock:
+            self._known_keys[image_path] = (stat.st_size, stat.st_mtime_ns, key)
+            self._known_keys.move_to_end(image_path)
+            while len(self._known_keys) > MAX_KNOWN_KEYS:
+                self._known_keys.popitem(last=False)
+        return key
+
+    # Memory LRU
+
+    def _memory_get(self, key: str, size: int) -> Optional[bytes]:
+        with self._lock:
+            data = self._memory.get((key, size))
+            if data is not None:
+                self._memory.move_to_end((key, size))
+            return data
+
+    def _memory_put(self, key: str, size: int, data: bytes):
+        with self._lock:
+            if (key, size) in self._memory:
+                return
+            self._memory[(key, size)] = data
+            self._memory_bytes += len(data)
+            while self._memory_bytes > self.max_memory_bytes and self._memory:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+
+    # Disk storage
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def _entry_path(self, key: str, size: int) -> str:
+        return os.path.join(self._entry_dir(key), f"{size}.webp")
+
+    def _write_level(self, path: str, image, image_path: str):
+        """Encode one pyramid level and move it into place"""
+        ok, encoded = cv2.imencode('.webp', image, [cv2.IMWRITE_WEBP_QUALITY, self.quality])
+        if not ok:
+            raise ValueError(f"Cannot encode thumbnail for {image_path}")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(encoded.tobytes())
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _link_level(source: str, path: str):
+        """Serve a level from an identical one already written"""
+        tmp_path = f"{path}.tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        try:
+            os.link(source, tmp_path)
+        except OSError:
+            shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, path)
+
+    def _entry_bytes(self, key: str) -> int:
+        """Disk usage of a pyramid, counting hardlinked levels once"""
+        inodes = {}
+        for size in self.sizes:
+            stat = os.stat(self._entry_path(key, size))
+            inodes[(stat.st_dev, stat.st_ino)] = stat.st_size
+        return sum(inodes.values())
+
+    def _on_disk(self, key: str) -> bool:
+        with self._lock:
+            if key in self._disk_index:
+                return True
+
+        # Another process sharing the cache directory may have generated it
+        files = [self._entry_path(key, size) for size in self.sizes]
+        if not all(os.path.exists(path) for path in files):
+            return False
+        total = self._entry_bytes(key)
+        with self._lock:
+            if key not in self._disk_index:
+                self._disk_index[key] = [total, time.time()]
+                self._disk_bytes += total
+        return True
+
+    def _touch(self, key: str):
+        """Record an access for disk LRU ordering"""
+        now = time.time()
+        with self._lock:
+            if key in self._disk_index:
+                self._disk_index[key][1] = now
+        try:
+            os.utime(self._entry_dir(key), (now, now))
+        except OSError:
+            pass
+
+    def _load_index(self):
+        """Rebuild the disk index from the cache directory"""
+        for shard in os.listdir(self.cache_dir):
+            shard_dir = os.path.join(self.cache_dir, shard)
+            if not os.path.isdir(shard_dir):
+                continue
+            for key in os.listdir(shard_dir):
+                entry_dir = os.path.join(shard_dir, key)
+                files = [os.path.join(entry_dir, f"{size}.webp") for size in self.sizes]
+                if not all(os.path.exists(path) for path in files):
+                    # Incomplete pyramid from an interrupted run; recent ones may
+                    # still be being written by another process
+                    if time.time() - os.path.getmtime(entry_dir) > INCOMPLETE_GRACE_SECONDS:
+                        shutil.rmtree(entry_dir, ignore_errors=True)
+                    continue
+                total = self._entry_bytes(key)
+                self._disk_index[key] = [total, os.path.getmtime(entry_dir)]
+                self._disk_bytes += total
+
+        self.logger.info(f"Thumbnail cache: {len(self._disk_index)} images, {self._disk_bytes / (1024 * 1024):.1f} MB")
+
+    def rescan(self):
+        """Re-read the whole cache directory, including other processes' pyramids, and evict to budget"""
+        with self._lock:
+            self._disk_index = {}
+            self._disk_bytes = 0
+        self._load_index()
+        self._evict()
+
+    def _evict(self):
+        """Remove least recently used pyramids until under the disk budget"""
+        with self._lock:
+            if self.max_disk_bytes is None or self._disk_bytes <= self.max_disk_bytes:
+                return
+
+            target = self.max_disk_bytes * 0.9
+            victims = []
+            for key, (total, _) in sorted(self._disk_index.items(), key=lambda item: item[1][1]):
+                if self._disk_bytes <= target:
+                    break
+                victims.append(key)
+                self._disk_bytes -= total
+                del self._disk_index[key]
+
+            for key in victims:
+                for size in self.sizes:
+                    self._memory_bytes -= len(self._memory.pop((key, size), b''))
+
+        for key in victims:
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+
+        self.logger.info(f"Evicted {len(victims)} thumbnail pyramids")
+
+
+def main():
+    """Warm thumbnails for sessions arriving in the incoming directory"""
+    if len(sys.argv) < 3:
+        print("Usage: python -m processing.thumbnail_cache <cache_dir> <incoming_dir>")
+        sys.exit(1)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    ThumbnailCache(sys.argv[1]).watch(sys.argv[2])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Materialises session files the Pi agent did not upload as plain files:
+pack segments and content another agent already stored (`duplicate_of`)
+"""
+
+import os
+import sys
+import json
+import shutil
+import logging
+from typing import Dict, Any, List, Optional
+
+# The agent writes a segment's index only after the segment verified
+SEGMENT_PREFIX = 'pack-'
+SEGMENT_SUFFIX = '.tar'
+INDEX_SUFFIX = '.index.json'
+STAGING_SUFFIX = '.partial'
+COPY_CHUNK = 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+def committed_segments(session_dir: str) -> List[str]:
+    """Segments of a session whose index has been written, in write order"""
+    return [
+        os.path.join(session_dir, name[:-len(INDEX_SUFFIX)])
+        for name in sorted(os.listdir(session_dir))
+        if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX + INDEX_SUFFIX)
+    ]
+
+
+def unpack_segment(segment_path: str) -> int:
+    """Expand one segment next to it; every member appears complete or not at all"""
+    session_dir = os.path.dirname(segment_path)
+    index_path = segment_path + INDEX_SUFFIX
+
+    # Segment already expanded and removed; only the index was left behind
+    if not os.path.exists(segment_path):
+        os.remove(index_path)
+        return 0
+
+    with open(index_path) as f:
+        index: Dict[str, Any] = json.load(f)
+
+    if os.path.getsize(segment_path) != index['size']:
+        raise ValueError(f"{segment_path} is {os.path.getsize(segment_path)} bytes, index says {index['size']}")
+
+    staging_dir = os.path.join(session_dir, f".{os.path.basename(segment_path)}{STAGING_SUFFIX}")
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    os.makedirs(staging_dir)
+
+    try:
+        # Copy every member out of the segment and flush it before any becomes visible
+        with open(segment_path, 'rb') as segment:
+            for entry in index['files']:
+                name = entry['name']
+                if os.path.basename(name) != name or name in ('', '.', '..'):
+                    raise ValueError(f"Refusing member name {name!r} in {segment_path}")
+
+                segment.seek(entry['offset'])
+                staged = os.path.join(staging_dir, name)
+                with open(staged, 'wb') as out:
+                    remaining = entry['size']
+                    while remaining:
+                        chunk = segment.read(min(COPY_CHUNK, remaining))
+                        if not chunk:
+                            raise ValueError(f"{segment_path} ends inside member {name}")
+                        out.write(chunk)
+                        remaining -= len(chunk)
+                    out.flush()
+                    os.fsync(out.fileno())
+                os.utime(staged, (entry['mtime'], entry['mtime']))
+
+        # Renames within one directory tree are atomic, and a crash before the
+        # segment is removed just repeats the expansion on the next run
+        for entry in index['files']:
+            os.replace(os.path.join(staging_dir, entry['name']), os.path.join(session_dir, entry['name']))
+        _fsync_directory(session_dir)
+
+        os.remove(segment_path)
+        os.remove(index_path)
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+    logger.info(f"Unpacked {len(index['files'])} files from {os.path.basename(segment_path)}")
+    return len(index['files'])
+
+
+def link_duplicates(session_dir: str) -> int:
+    """Link in files the manifest lists as stored by another agent; returns the number still missing"""
+    try:
+        with open(os.path.join(session_dir, 'manifest.json')) as f:
+            files = json.load(f).get('files', {})
+    except (OSError, ValueError):
+        # No manifest yet, so no duplicates are known
+        return 0
+
+    missing = 0
+    for name, entry in files.items():
+        target = os.path.join(session_dir, name)
+        if not entry.get('duplicate_of') or os.path.exists(target):
+            continue
+        try:
+            _materialize(_shared_path(session_dir, entry['duplicate_of']), target, entry.get('size'))
+            logger.info(f"Linked {name} from {entry['duplicate_of']}")
+        except Exception as e:
+            logger.error(f"Failed to link {name} from {entry['duplicate_of']}: {e}")
+            missing += 1
+    return missing
+
+
+def materialize_session(session_dir: str) -> int:
+    """Expand committed segments and link in duplicates; returns the number of files or segments unresolved"""
+    failed = 0
+    for segment_path in committed_segments(session_dir):
+        try:
+            unpack_segment(segment_path)
+        except Exception as e:
+            logger.error(f"Failed to unpack {segment_path}: {e}")
+            failed += 1
+    return failed + link_duplicates(session_dir)
+
+
+def _shared_path(session_dir: str, share_path: str) -> str:
+    """Local path of a file the agents recorded by its path on the share (<base>/<session>/<name>)"""
+    session, name = share_path.replace('\\', '/').strip('/').split('/')[-2:]
+    return os.path.join(os.path.dirname(os.path.abspath(session_dir)), session, name)
+
+
+def _materialize(source: str, target: str, size: Optional[int]):
+    """Hardlink (or copy, across filesystems) source to target; the target appears complete or not at all"""
+    if size is not None and os.path.getsize(source) != size:
+        raise ValueError(f"{source} is {os.path.getsize(source)} bytes, manifest says {size}")
+
+    temp_path = os.path.join(os.path.dirname(target), f".{os.path.basename(target)}{STAGING_SUFFIX}")
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    try:
+        os.link(source, temp_path)
+    except OSError:
+        shutil.copy2(source, temp_path)
+        with open(temp_path, 'rb') as f:
+            os.fsync(f.fileno())
+    os.replace(temp_path, target)
+    _fsync_directory(os.path.dirname(target))
+
+
+def _fsync_directory(path: str):
+    """Persist the directory entries created by renames"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def main():
+    """Materialise one or more session directories"""
+    if len(sys.argv) < 2:
+        print("Usage: python -m processing.unpacker <session_dir> [<session_dir> ...]")
+        sys.exit(1)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    failed = sum(materialize_session(session_dir) for session_dir in sys.argv[1:])
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
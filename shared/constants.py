@@ -16,6 +16,9 @@ DEFAULT_CHUNK_SIZE = 1048576  # 1MB
 DEFAULT_MAX_RETRIES = 3
 DEFAULT_RETRY_DELAY = 5  # seconds
 
+# Thumbnail pyramid sizes (longest edge in pixels)
+THUMBNAIL_SIZES = [256, 1024, 2048]
+
 # Phase definitions
 PHASES = {
     1: "Basic file transfer system",